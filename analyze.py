@@ -0,0 +1,181 @@
+import argparse
+import copy
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from detection import *
+from detection_log import *
+from export import *
+from frame_cache import *
+from settings import *
+from tracker import *
+
+
+class AnalysisResult:
+    def __init__(self, tracks, frames, elapsed, frequency):
+        # {id: summary} when kept in memory, the number of written tracks when streamed to a TrackWriter
+        self.tracks = tracks
+        self.frames = frames
+        self.elapsed = elapsed
+        self.frequency = frequency
+
+    @property
+    def fps(self):
+        return self.frames / self.elapsed if self.elapsed > 0 else 0
+
+
+# log_path: where to write the raw detections (DetectionLog), created once the frame rate is known
+def analyze_video(video_path, settings, scaling_coefficient=1, workers=1, cache=None, writer=None, log_path=None):
+    start = time.perf_counter()
+    cache_entry = None
+    if cache is not None:
+        cache_entry = cache.fetch(video_path, settings.detection_width)
+        frames, frequency, _ = load_frames(cache_entry)
+        frame_count = len(frames)
+        del frames
+    else:
+        video = cv2.VideoCapture(video_path)
+        if not video.isOpened():
+            raise IOError('Can not open video ' + video_path)
+        frequency = video.get(cv2.CAP_PROP_FPS) or 50
+        frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        video.release()
+
+    log = DetectionLog(log_path, frequency) if log_path else None
+    tracker = Tracker(settings.tracking_distance, settings.assignment, writer,
+                      prediction_gate=settings.prediction_gate, log=log)
+    frames = 0
+    try:
+        if workers > 1 and frame_count > 0 and not stateful_detection(settings):
+            chunks = detect_parallel(video_path, settings, frame_count, workers, cache_entry)
+        else:
+            # frames are detected one at a time as the tracker asks for them, so it can guide the detector
+            chunks = [iter_detections(video_path, settings, 0, None, cache_entry, tracker)]
+        # tracking is sequential by nature, so chunks are merged strictly in frame order
+        for chunk in chunks:
+            for detections in chunk:
+                # decode time of a constant rate file
+                tracker.update(detections, frequency, scaling_coefficient, frames / frequency)
+                frames += 1
+        tracker.close()
+    finally:
+        if log is not None:
+            log.close()
+    elapsed = time.perf_counter() - start
+
+    tracks = writer.track_count if writer is not None else tracker.for_processing
+    return AnalysisResult(tracks, frames, elapsed, frequency)
+
+
+# tracking only, on the detections a previous run logged
+def analyze_log(log_path, settings, scaling_coefficient=1, writer=None):
+    start = time.perf_counter()
+    tracker, frames, frequency = replay_log(log_path, settings.tracking_distance, settings.assignment,
+                                            settings.prediction_gate, scaling_coefficient, writer)
+    elapsed = time.perf_counter() - start
+    tracks = writer.track_count if writer is not None else tracker.for_processing
+    return AnalysisResult(tracks, frames, elapsed, frequency)
+
+
+def iter_grays(video_path, width, first_frame, last_frame, cache_entry=None):
+    if cache_entry is not None:
+        frames, _, scale = load_frames(cache_entry)
+        for gray in frames[first_frame:last_frame]:
+            yield gray, scale
+        return
+    video = cv2.VideoCapture(video_path)
+    if first_frame > 0:
+        video.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    frame_index = first_frame
+    while last_frame is None or frame_index < last_frame:
+        ret, frame = video.read()
+        if not ret:
+            break
+        yield prepare_frame(frame, width)
+        frame_index += 1
+    video.release()
+
+
+def iter_detections(video_path, settings, first_frame, last_frame, cache_entry=None, tracker=None):
+    detector = Detector(settings)
+    try:
+        for gray, scale in iter_grays(video_path, settings.detection_width, first_frame, last_frame, cache_entry):
+            yield detector.detect(gray, scale, tracker)
+    finally:
+        detector.close()
+
+
+# detection that depends on earlier frames: the contour background, the motion gate's reference and the
+# windows around tracker predictions; a frame range started in another process would begin without that
+# history, so these settings are detected serially
+def stateful_detection(settings):
+    return settings.engine != HOUGH or settings.motion_threshold > 0 or settings.detection_interval > 1
+
+
+def detect_range(video_path, settings, first_frame, last_frame, cache_entry=None):
+    # the ranges already run one per process, strip threads in every process would only oversubscribe the cores
+    settings = copy.copy(settings)
+    settings.detection_threads = 1
+    return list(iter_detections(video_path, settings, first_frame, last_frame, cache_entry))
+
+
+def split_frames(frame_count, chunks):
+    bounds = [frame_count * i // chunks for i in range(chunks + 1)]
+    # the reported frame count is only an estimate, the last range reads to the end of the file
+    return [(bounds[i], bounds[i + 1] if i < chunks - 1 else None) for i in range(chunks)]
+
+
+def detect_parallel(video_path, settings, frame_count, workers, cache_entry=None):
+    # a few ranges per worker keep the pool busy when some ranges decode slower than others
+    ranges = split_frames(frame_count, min(frame_count, workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(detect_range, video_path, settings, first, last, cache_entry)
+                   for first, last in ranges]
+        for future in futures:
+            yield future.result()
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Headless detection and tracking of a video file')
+    parser.add_argument('video', help='path to .mov/.mp4 file, or a %s detection log to track again' % LOG_EXTENSION)
+    parser.add_argument('-o', '--output', default='tracks.csv', help='per-track results (csv)')
+    parser.add_argument('--detections', help='per-frame tracked objects (csv)')
+    parser.add_argument('--log', help='raw detections of every frame (%s), replayed much faster than the video'
+                                      % LOG_EXTENSION)
+    parser.add_argument('-s', '--settings', default=SETTINGS_FILE, help='detection settings file')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='detection processes (frame ranges in parallel)')
+    parser.add_argument('--cache', help='directory for decoded frames, reused by later runs on the same file')
+    parser.add_argument('--cache-size', type=float, default=CACHE_SIZE / 1024 ** 3, help='cache limit in GB')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = Settings()
+    try:
+        settings.load(args.settings)
+    except Exception as e:
+        print(str(e) + '(file settings incorrect, defaults are used)', file=sys.stderr)
+
+    if args.workers > 1 and stateful_detection(settings):
+        print('detection depends on earlier frames with these settings, -j is ignored', file=sys.stderr)
+    cache = FrameCache(args.cache, int(args.cache_size * 1024 ** 3)) if args.cache else None
+    writer = TrackWriter(args.output, args.detections)
+    try:
+        if args.video.endswith(LOG_EXTENSION):
+            result = analyze_log(args.video, settings, writer=writer)
+        else:
+            result = analyze_video(args.video, settings, workers=args.workers, cache=cache, writer=writer,
+                                   log_path=args.log)
+    finally:
+        writer.close()
+    print('%d frames in %.2f s: %.1f fps, %d tracks' % (
+        result.frames, result.elapsed, result.fps, result.tracks))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
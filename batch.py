@@ -0,0 +1,152 @@
+import argparse
+import copy
+import csv
+import glob
+import hashlib
+import multiprocessing
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+from analyze import *
+from detection_log import *
+from export import *
+from settings import *
+
+VIDEO_EXTENSIONS = ('.mov', '.mp4')
+SUMMARY_FILE = 'summary.csv'
+SUMMARY_HEADER = ['file', 'output', 'status', 'frames', 'tracks', 'mean_speed', 'fps', 'elapsed', 'error']
+PARTIAL_SUFFIX = '.part'
+
+
+# directories are searched for videos, anything else is taken as a glob pattern
+def find_videos(inputs):
+    videos = []
+    for path in inputs:
+        if os.path.isdir(path):
+            names = sorted(os.listdir(path))
+            videos += [os.path.join(path, name) for name in names if name.lower().endswith(VIDEO_EXTENSIONS)]
+        else:
+            videos += sorted(glob.glob(path))
+    return list(dict.fromkeys(os.path.abspath(video) for video in videos))
+
+
+# files already in the summary with status ok are not processed again, failed ones are retried
+def load_summary(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', newline='') as file:
+        return {row['file']: row for row in csv.DictReader(file)}
+
+
+# the name part of the path is for people, the hash keeps day1/run.mp4, day2/run.mp4 and run.mov apart
+def output_name(video_path):
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return '%s_%s' % (stem, hashlib.sha1(os.path.abspath(video_path).encode()).hexdigest()[:8])
+
+
+def init_worker():
+    # the pool already runs one file per core, OpenCV's own threads would only compete with it
+    cv2.setNumThreads(1)
+
+
+def process_file(job):
+    video_path, settings, output_directory = job
+    # one file per core already, tiled detection is for the latency of live frames
+    settings = copy.copy(settings)
+    settings.detection_threads = 1
+    row = dict.fromkeys(SUMMARY_HEADER, '')
+    row['file'] = video_path
+    row['output'] = output_name(video_path)
+    name = os.path.join(output_directory, row['output'])
+    outputs = [name + '.tracks.csv', name + LOG_EXTENSION]
+    # written under temporary names and renamed when complete, a worker killed half way leaves only .part files
+    partials = [path + PARTIAL_SUFFIX for path in outputs]
+    writer = TrackWriter(partials[0])
+    result = None
+    try:
+        result = analyze_video(video_path, settings, writer=writer, log_path=partials[1])
+    except Exception as e:
+        row.update(status='failed', error=str(e))
+    finally:
+        writer.close()
+    for partial, path in zip(partials, outputs):
+        if result is None:
+            if os.path.exists(partial):
+                os.remove(partial)
+        else:
+            os.replace(partial, path)
+    if result is None:
+        return row
+    # same filter as data processing: very slow tracks are standing noise
+    speeds = [summary[3] for summary in load_tracks(outputs[0]).values() if summary[3] > 0.1]
+    row.update(status='ok', frames=result.frames, tracks=result.tracks,
+               mean_speed='%.3f' % np.mean(speeds) if speeds else '', fps='%.1f' % result.fps,
+               elapsed='%.2f' % result.elapsed)
+    return row
+
+
+def run_batch(videos, settings, output_directory, workers, summary_path=None):
+    os.makedirs(output_directory, exist_ok=True)
+    summary_path = summary_path or os.path.join(output_directory, SUMMARY_FILE)
+    done = load_summary(summary_path)
+    pending = [video for video in videos if done.get(video, {}).get('status') != 'ok']
+    # the longest files first, so one big file does not start last and keep a single core busy
+    pending.sort(key=os.path.getsize, reverse=True)
+    rows = [row for row in done.values() if row['status'] == 'ok']
+
+    with open(summary_path, 'w', newline='') as file:
+        summary = csv.DictWriter(file, SUMMARY_HEADER)
+        summary.writeheader()
+        summary.writerows(rows)
+        file.flush()
+        # a worker process is replaced after every file, whatever a file leaves behind is freed with it
+        with multiprocessing.Pool(workers, initializer=init_worker, maxtasksperchild=1) as pool:
+            jobs = [(video, settings, output_directory) for video in pending]
+            for row in pool.imap_unordered(process_file, jobs):
+                # every finished file is on disk at once, an interrupted batch resumes from here
+                summary.writerow(row)
+                file.flush()
+                rows.append(row)
+                print('%-6s %s %s' % (row['status'], row['file'], row['error'] or '%s tracks, %s fps' % (
+                    row['tracks'], row['fps'])))
+    return rows, len(videos) - len(pending)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Detection and tracking of every video in directories or globs')
+    parser.add_argument('inputs', nargs='+', help='directories with .mov/.mp4 files or glob patterns')
+    parser.add_argument('-o', '--output', default='batch', help='directory for per-file results and ' + SUMMARY_FILE)
+    parser.add_argument('-s', '--settings', default=SETTINGS_FILE, help='detection settings file')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='worker processes, one file each')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = Settings()
+    try:
+        settings.load(args.settings)
+    except Exception as e:
+        print(str(e) + '(file settings incorrect, defaults are used)', file=sys.stderr)
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        print('no videos found', file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    rows, skipped = run_batch(videos, settings, args.output, args.workers)
+    elapsed = time.perf_counter() - start
+
+    failed = [row for row in rows if row['status'] != 'ok']
+    frames = sum(int(row['frames']) for row in rows if row['status'] == 'ok' and row['frames'])
+    print('%d files (%d done before, %d failed) in %.1f s, %d frames' % (
+        len(videos), skipped, len(failed), elapsed, frames))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+import argparse
+import sys
+
+from detection import *
+from settings import *
+from benchmark.suite import *
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmark',
+                                     description='Detection and tracking benchmark on synthetic falling spheres')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='machine readable report (json)')
+    parser.add_argument('-s', '--settings', default=SETTINGS_FILE, help='detection settings file')
+    parser.add_argument('--compare', help='previous report to compare against')
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--particles', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--noise', type=float, nargs='+', default=[0, 10])
+    parser.add_argument('--blur', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--engines', nargs='+', choices=sorted(ENGINES), default=[HOUGH, CONTOURS],
+                        help='detector engines to compare')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = Settings()
+    try:
+        settings.load(args.settings)
+    except Exception as e:
+        print(str(e) + '(file settings incorrect, defaults are used)', file=sys.stderr)
+
+    report = run_suite(settings, args.particles, args.noise, args.blur, args.frames, args.seed, args.engines)
+    save_report(args.output, report)
+    for case in report['cases']:
+        fps = case['fps']
+        result = case['accuracy']
+        print('%-22s %8.1f fps (detect %8.1f, track %8.1f) | recall %.2f, id switches %d, missed %d, speed error %s' % (
+            case['name'], fps['total'], fps['detect'], fps['track'], result['recall'], result['id_switches'],
+            result['missed_tracks'],
+            '-' if result['speed_error_mean'] is None else '%.1f%%' % (result['speed_error_mean'] * 100)))
+    if args.compare:
+        for line in compare(report, load_report(args.compare)):
+            print(line)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what headless tools (analyze, batch, sessions) import; none of it may pull in Qt
+CORE_IMPORTS = 'import detection, detection_log, export, settings, tracker'
+CORE_CHECK = CORE_IMPORTS + '''
+import sys
+if 'PyQt5' in sys.modules:
+    sys.exit('PyQt5 was imported by ' + %r)
+''' % CORE_IMPORTS
+WINDOW_CHECK = '''
+import sys
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+from view import View
+win = View()
+win.show()
+app.processEvents()
+'''
+
+# seconds from starting the interpreter, about twice the measured median (0.09 s and 0.14 s) so that
+# pulling scipy.optimize (0.27 s) back into either path fails, slower lab PCs pass their own with --*-budget
+CORE_BUDGET = 0.2
+WINDOW_BUDGET = 0.3
+
+
+# wall time of a fresh interpreter until the code has run, so interpreter start and every import are included
+def measure(code, imports=False):
+    # the child reports the moment it is done, interpreter shutdown is not part of the startup
+    code += '\nimport time\nprint("done %r" % time.time())\n'
+    command = [sys.executable] + (['-X', 'importtime'] if imports else []) + ['-c', code]
+    start = time.time()
+    result = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or result.stdout.strip())
+    done = [line for line in result.stdout.splitlines() if line.startswith('done ')]
+    return float(done[-1][len('done '):]) - start, result.stderr
+
+
+# the modules with the largest cumulative import time, from python -X importtime
+def slowest_imports(report, count):
+    imports = []
+    for line in report.splitlines():
+        parts = line.split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        imports.append((int(parts[1]) / 1e6, parts[2].rstrip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+def run_startup(repeat, core_budget=CORE_BUDGET, window_budget=WINDOW_BUDGET, imports=0):
+    results = []
+    for name, code, budget in (('core import', CORE_CHECK, core_budget), ('first window', WINDOW_CHECK, window_budget)):
+        times = [measure(code)[0] for _ in range(repeat)]
+        report = measure(code, imports=True)[1] if imports else ''
+        # the median, a single slow start because of the disk cache should not fail it
+        results.append({'name': name, 'median': float(np.median(times)), 'best': min(times), 'budget': budget,
+                        'imports': slowest_imports(report, imports)})
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmark.startup',
+                                     description='Start-up time of the headless modules and of the main window')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='fresh interpreters per measurement')
+    parser.add_argument('--core-budget', type=float, default=CORE_BUDGET, help='seconds for the headless imports')
+    parser.add_argument('--window-budget', type=float, default=WINDOW_BUDGET, help='seconds until the window shows')
+    parser.add_argument('--imports', type=int, default=0, metavar='N', help='list the N slowest imports')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        results = run_startup(args.repeat, args.core_budget, args.window_budget, args.imports)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    failed = False
+    for result in results:
+        over = result['median'] > result['budget']
+        failed |= over
+        print('%-12s %6.3f s (best %.3f s, budget %.3f s)%s' % (
+            result['name'], result['median'], result['best'], result['budget'], ' OVER BUDGET' if over else ''))
+        for seconds, module in result['imports']:
+            print('    %6.3f s %s' % (seconds, module))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import collections
+import copy
+import itertools
+import json
+import platform
+import time
+
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from detection import *
+from settings import *
+from tracker import *
+from benchmark.synthetic import *
+
+STAGES = ['prepare', 'detect', 'track']
+
+
+# pairs visible spheres with tracker output, a sphere counts as found within half its radius (at least 3 px)
+def match_truth(truth, objects):
+    if not truth or not objects:
+        return [], len(objects)
+    spheres = np.array([(x, y, r) for _, x, y, r in truth], dtype=np.float64)
+    found = np.array([(x, y) for x, y, _, _ in objects], dtype=np.float64)
+    distances = np.hypot(spheres[:, 0, None] - found[None, :, 0], spheres[:, 1, None] - found[None, :, 1])
+    allowed = distances <= np.maximum(spheres[:, 2, None] / 2, 3)
+    rows, columns = linear_sum_assignment(np.where(allowed, distances, 1e9))
+    pairs = [(truth[i][0], objects[j][3]) for i, j in zip(rows, columns) if allowed[i, j]]
+    return pairs, len(objects) - len(pairs)
+
+
+def accuracy(scene, visible, matched, tracks):
+    id_switches = 0
+    missed_tracks = 0
+    speed_errors = []
+    for index, sphere in enumerate(scene.spheres):
+        if visible[index] == 0:
+            continue
+        ids = matched[index]
+        if len(ids) < visible[index] / 2:
+            missed_tracks += 1
+        id_switches += sum(1 for previous, current in zip(ids, ids[1:]) if previous != current)
+        if not ids:
+            continue
+        # the track that followed the sphere longest is the one a user would read the speed from
+        object_id = collections.Counter(ids).most_common(1)[0][0]
+        if object_id in tracks:
+            true_speed = sphere.speed * scene.frequency
+            speed_errors.append(abs(tracks[object_id][3] - true_speed) / true_speed)
+    return {
+        'spheres': int(np.count_nonzero(visible)),
+        'recall': sum(len(ids) for ids in matched) / max(1, int(visible.sum())),
+        'id_switches': id_switches,
+        'missed_tracks': missed_tracks,
+        'speed_error_mean': float(np.mean(speed_errors)) if speed_errors else None,
+        'speed_error_max': float(np.max(speed_errors)) if speed_errors else None,
+    }
+
+
+def run_case(scene, settings):
+    detector = Detector(settings)
+    tracker = Tracker(settings.tracking_distance, settings.assignment, prediction_gate=settings.prediction_gate)
+    times = dict.fromkeys(STAGES, 0.0)
+    visible = np.zeros(len(scene.spheres), dtype=np.int64)
+    matched = [[] for _ in scene.spheres]
+    false_positives = 0
+
+    for frame, truth in scene:
+        start = time.perf_counter()
+        gray, scale = prepare_frame(frame, settings.detection_width)
+        prepared = time.perf_counter()
+        detections = detector.detect(gray, scale, tracker)
+        detected = time.perf_counter()
+        objects = tracker.update(detections, scene.frequency, 1, tracker.frame_index / scene.frequency)
+        tracked = time.perf_counter()
+        times['prepare'] += prepared - start
+        times['detect'] += detected - prepared
+        times['track'] += tracked - detected
+
+        for index, _, _, _ in truth:
+            visible[index] += 1
+        pairs, unmatched = match_truth(truth, objects)
+        for index, object_id in pairs:
+            matched[index].append(object_id)
+        false_positives += unmatched
+
+    detector.close()
+    fps = {stage: scene.frames / seconds if seconds > 0 else None for stage, seconds in times.items()}
+    fps['total'] = scene.frames / sum(times.values())
+    result = accuracy(scene, visible, matched, tracker.for_processing)
+    result['false_positives'] = false_positives
+    return {'frames': scene.frames, 'fps': fps, 'accuracy': result}
+
+
+def run_suite(settings, particles=(1, 5, 20), noise=(0, 10), blur=(1, 5), frames=300, seed=0, engines=(HOUGH,)):
+    cases = []
+    for count, sigma, kernel in itertools.product(particles, noise, blur):
+        scene = Scene(particles=count, frames=frames, noise=sigma, blur=kernel, seed=seed)
+        # every engine runs on the same scene, so the cases differ only by the detector
+        for engine in engines:
+            engine_settings = copy.copy(settings)
+            engine_settings.engine = engine
+            case = {'name': '%s_p%d_n%g_b%d' % (engine, count, sigma, kernel), 'engine': engine,
+                    'particles': count, 'noise': sigma, 'blur': kernel}
+            case.update(run_case(scene, engine_settings))
+            cases.append(case)
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'settings': vars(settings),
+        'cases': cases,
+    }
+
+
+def compare(report, previous):
+    before = {case['name']: case for case in previous['cases']}
+    lines = []
+    for case in report['cases']:
+        old = before.get(case['name'])
+        if old is None:
+            continue
+        change = (case['fps']['total'] / old['fps']['total'] - 1) * 100
+        lines.append('%-22s total fps %8.1f -> %8.1f (%+.1f%%), id switches %d -> %d, missed %d -> %d' % (
+            case['name'], old['fps']['total'], case['fps']['total'], change,
+            old['accuracy']['id_switches'], case['accuracy']['id_switches'],
+            old['accuracy']['missed_tracks'], case['accuracy']['missed_tracks']))
+    return lines
+
+
+def save_report(path, report):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2)
+
+
+def load_report(path):
+    with open(path, 'r') as file:
+        return json.load(file)
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+BACKGROUND = 200
+SPHERE = 40
+# sub-pixel drawing: cv2.circle coordinates are multiplied by 2 ** SHIFT
+SHIFT = 4
+SIZE = (800, 450)
+
+
+class Sphere:
+    def __init__(self, x, y, radius, speed):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.speed = speed
+
+    def position(self, frame):
+        return self.x, self.y + self.speed * frame
+
+
+# spheres fall straight down at their terminal speed, which grows with r^2 as in Stokes' law
+class Scene:
+    def __init__(self, particles=5, frames=300, noise=0.0, blur=1, frequency=50, seed=0,
+                 radius_range=(6, 20), speed_factor=0.02, size=SIZE):
+        self.frames = frames
+        self.noise = noise
+        self.blur = blur
+        self.frequency = frequency
+        self.size = size
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+
+        width, height = size
+        self.spheres = []
+        for _ in range(particles):
+            radius = rng.uniform(*radius_range)
+            speed = speed_factor * radius ** 2
+            x = rng.uniform(width * 0.25, width * 0.75)
+            # start anywhere above the bottom edge so that spheres enter during the whole clip
+            y = rng.uniform(-speed * frames * 0.5, height * 0.5)
+            self.spheres.append(Sphere(x, y, radius, speed))
+
+    def visible(self, frame):
+        width, height = self.size
+        result = []
+        for index, sphere in enumerate(self.spheres):
+            x, y = sphere.position(frame)
+            if sphere.radius <= x <= width - sphere.radius and sphere.radius <= y <= height - sphere.radius:
+                result.append((index, x, y, sphere.radius))
+        return result
+
+    def render(self, frame):
+        width, height = self.size
+        image = np.full((height, width), BACKGROUND, dtype=np.uint8)
+        scale = 1 << SHIFT
+        for sphere in self.spheres:
+            x, y = sphere.position(frame)
+            cv2.circle(image, (int(round(x * scale)), int(round(y * scale))), int(round(sphere.radius * scale)),
+                       SPHERE, -1, cv2.LINE_AA, SHIFT)
+        if self.blur > 1:
+            image = cv2.GaussianBlur(image, (self.blur | 1, self.blur | 1), 0)
+        if self.noise > 0:
+            # seeded per frame, so a frame renders the same whether it is played or written to a file
+            rng = np.random.default_rng((self.seed, frame))
+            noisy = image + rng.normal(0, self.noise, image.shape)
+            image = np.clip(noisy, 0, 255).astype(np.uint8)
+        return cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+
+    # yields (frame, ground truth) where ground truth lists (sphere index, x, y, r) of fully visible spheres
+    def __iter__(self):
+        for frame in range(self.frames):
+            yield self.render(frame), self.visible(frame)
+
+    def write(self, path, fourcc='mp4v'):
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), self.frequency, self.size)
+        for frame, _ in self:
+            writer.write(frame)
+        writer.release()
@@ -0,0 +1,90 @@
+import argparse
+import copy
+import itertools
+import os
+import sys
+
+from detection import *
+from settings import *
+from tracker import *
+from benchmark.synthetic import *
+
+
+# detection and tracking of one scene, per frame the detections and the tracked objects, then the finished tracks
+def track_scene(scene, settings):
+    detector = Detector(settings)
+    tracker = Tracker(settings.tracking_distance, settings.assignment, prediction_gate=settings.prediction_gate)
+    frames = []
+    for frame, _ in scene:
+        gray, scale = prepare_frame(frame, settings.detection_width)
+        detections = detector.detect(gray, scale, tracker)
+        objects = tracker.update(detections, scene.frequency, 1, tracker.frame_index / scene.frequency)
+        frames.append((detections, objects))
+    detector.close()
+    tracker.close()
+    return frames, tracker.for_processing
+
+
+# the first frame where strips give other detections or tracking output than the whole frame, None if there is none
+def first_difference(whole, tiled):
+    for index, (expected, actual) in enumerate(zip(whole[0], tiled[0])):
+        if expected[0] != actual[0]:
+            return index, 'detections'
+        if expected[1] != actual[1]:
+            return index, 'objects'
+    if whole[1] != tiled[1]:
+        return len(whole[0]), 'tracks'
+    return None
+
+
+def run_check(settings, threads, particles=(1, 5, 20), noise=(0, 10), blur=(1, 5), frames=100, seed=0):
+    whole_settings = copy.copy(settings)
+    whole_settings.detection_threads = 1
+    tiled_settings = copy.copy(settings)
+    tiled_settings.detection_threads = threads
+    results = []
+    for count, sigma, kernel in itertools.product(particles, noise, blur):
+        scene = Scene(particles=count, frames=frames, noise=sigma, blur=kernel, seed=seed)
+        whole = track_scene(scene, whole_settings)
+        tiled = track_scene(scene, tiled_settings)
+        results.append({'name': 'p%d_n%g_b%d' % (count, sigma, kernel), 'tracks': len(whole[1]),
+                        'difference': first_difference(whole, tiled)})
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmark.tiled',
+                                     description='Checks that tiled detection tracks exactly like the whole frame')
+    parser.add_argument('-s', '--settings', default=SETTINGS_FILE, help='detection settings file')
+    parser.add_argument('-t', '--threads', type=int, default=max(os.cpu_count() or 1, 4),
+                        help='strips per frame of the tiled run')
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--particles', type=int, nargs='+', default=[1, 5, 20])
+    parser.add_argument('--noise', type=float, nargs='+', default=[0, 10])
+    parser.add_argument('--blur', type=int, nargs='+', default=[1, 5])
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = Settings()
+    try:
+        settings.load(args.settings)
+    except Exception as e:
+        print(str(e) + '(file settings incorrect, defaults are used)', file=sys.stderr)
+    if settings.engine != HOUGH or settings.maximum_radius <= 0:
+        print('tiled detection needs the Hough engine and a maximum radius', file=sys.stderr)
+        return 1
+
+    failed = False
+    for result in run_check(settings, args.threads, args.particles, args.noise, args.blur, args.frames, args.seed):
+        difference = result['difference']
+        failed |= difference is not None
+        print('%-12s %4d tracks %s' % (result['name'], result['tracks'], 'identical' if difference is None else
+                                       'DIFFERENT %s from frame %d' % (difference[1], difference[0])))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,172 @@
+import glob
+import sys
+import threading
+import time
+
+import cv2
+
+SYNTHETIC = 'Synthetic spheres'
+
+
+# every source calls submit(frame, timestamp) from its own thread as frames arrive; with a DROP_OLDEST
+# FramePipeline behind it the submit queue is the ring buffer that keeps only the newest frames
+class VideoCaptureSource:
+    def __init__(self, device=0, api=None):
+        self.device = device
+        # V4L2 directly on Linux, whatever OpenCV picks elsewhere
+        self.api = api if api is not None else (cv2.CAP_V4L2 if sys.platform.startswith('linux') else cv2.CAP_ANY)
+        self.video = None
+        self.frequency = 50
+        self.running = False
+        self.thread = None
+
+    def start(self, submit):
+        self.video = cv2.VideoCapture(self.device, self.api)
+        if not self.video.isOpened():
+            self.video.release()
+            raise IOError('Can not open camera %s' % self.device)
+        self.frequency = self.video.get(cv2.CAP_PROP_FPS) or 50
+        # the driver queue would hand out stale frames, the newest one is all detection needs
+        self.video.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(submit,), name='capture', daemon=True)
+        self.thread.start()
+
+    # read() blocks until the device delivers, so the loop runs exactly at the camera rate
+    def run(self, submit):
+        while self.running:
+            ret, frame = self.video.read()
+            if not ret:
+                break
+            submit(frame, time.perf_counter())
+        self.running = False
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.video is not None:
+            self.video.release()
+            self.video = None
+
+
+# a file or a synthetic scene played at a fixed rate like a live camera, for load tests without one
+class ReplaySource:
+    def __init__(self, source, rate=None, loop=True):
+        # source: path to a video file or an iterable of (frame, truth) such as benchmark.synthetic.Scene
+        self.source = source
+        self.rate = rate
+        self.loop = loop
+        self.frequency = rate or 50
+        self.running = False
+        self.thread = None
+
+    def start(self, submit):
+        if isinstance(self.source, str):
+            video = cv2.VideoCapture(self.source)
+            if not video.isOpened():
+                raise IOError('Can not open video ' + self.source)
+            self.frequency = self.rate or video.get(cv2.CAP_PROP_FPS) or 50
+            video.release()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(submit,), name='replay', daemon=True)
+        self.thread.start()
+
+    def frames(self):
+        if not isinstance(self.source, str):
+            for frame, _ in self.source:
+                yield frame
+            return
+        video = cv2.VideoCapture(self.source)
+        while True:
+            ret, frame = video.read()
+            if not ret:
+                break
+            yield frame
+        video.release()
+
+    # frames are due on a fixed schedule, a late submit does not shift the following ones
+    def run(self, submit):
+        period = 1 / self.frequency
+        due = time.perf_counter()
+        while self.running:
+            for frame in self.frames():
+                if not self.running:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                submit(frame, time.perf_counter())
+                due += period
+            if not self.loop:
+                break
+        self.running = False
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+# pygrabber is Windows only and imported on first use
+class DirectShowSource:
+    def __init__(self, index):
+        self.index = index
+        self.graph = None
+        self.frequency = 50
+        self.running = False
+        self.thread = None
+
+    def start(self, submit):
+        from pygrabber.dshow_graph import FilterGraph
+        self.graph = FilterGraph()
+        self.graph.add_video_input_device(self.index)
+        self.graph.add_sample_grabber(lambda image: submit(image, time.perf_counter()))
+        self.graph.add_null_render()
+        self.graph.prepare_preview_graph()
+        self.graph.run()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='capture', daemon=True)
+        self.thread.start()
+
+    # the sample grabber only delivers on request, one request per frame period
+    def run(self):
+        period = 1 / self.frequency
+        while self.running:
+            self.graph.grab_frame()
+            time.sleep(period)
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.graph is not None:
+            self.graph.stop()
+            self.graph = None
+
+
+def directshow_available():
+    return sys.platform == 'win32'
+
+
+# names for the camera list, the synthetic source is always last
+def device_names():
+    if directshow_available():
+        from pygrabber.dshow_graph import FilterGraph
+        names = FilterGraph().get_input_devices()
+    else:
+        names = sorted(glob.glob('/dev/video*'))
+    return names + [SYNTHETIC]
+
+
+def open_source(index, name, rate=None):
+    if name == SYNTHETIC:
+        from benchmark.synthetic import Scene
+        return ReplaySource(Scene(particles=5, frames=500), rate)
+    if directshow_available():
+        return DirectShowSource(index)
+    device = int(name[len('/dev/video'):]) if name.startswith('/dev/video') else index
+    return VideoCaptureSource(device)
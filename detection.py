@@ -0,0 +1,274 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+DETECTION_WIDTH = 800
+
+HOUGH = 'hough'
+CONTOURS = 'contours'
+
+
+# detection runs on a gray copy resized to the given width (0 - native), scale maps it back to native pixels
+def prepare_frame(img, width=DETECTION_WIDTH, profiler=None):
+    height = img.shape[0]
+    scale = 1
+    if width and width != img.shape[1]:
+        scale = img.shape[1] / width
+        img = cv2.resize(img, (width, int(round(height / scale))))
+    if profiler is not None:
+        profiler.lap('resize')
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if profiler is not None:
+        profiler.lap('gray')
+    gray = cv2.blur(gray, (3, 3))
+    if profiler is not None:
+        profiler.lap('blur')
+    return gray, scale
+
+
+NO_CIRCLES = np.zeros((0, 3), dtype=np.float32)
+
+
+# sizes in settings are native pixels, the engine converts them to the pixels of the image it gets
+class HoughDetector:
+    def __init__(self, settings):
+        self.settings = settings
+
+    def detect(self, gray, scale=1):
+        circles = cv2.HoughCircles(
+            gray,
+            cv2.HOUGH_GRADIENT,
+            self.settings.resolution_scale,
+            max(self.settings.minimum_center_distance / scale, 1),
+            param1=self.settings.param1,
+            param2=self.settings.param2,
+            minRadius=int(self.settings.minimum_radius / scale),
+            maxRadius=int(np.ceil(self.settings.maximum_radius / scale))
+        )
+        if circles is None:
+            return NO_CIRCLES
+        return circles[0]
+
+
+# for a fixed camera: pixels that differ from a running average of the frames are foreground and each blob is
+# fitted with its enclosing circle, the cost does not depend on the radius range the way the Hough accumulator does
+class ContourDetector:
+    LEVEL = 25
+    LEARNING_RATE = 0.02
+    # foreground still fades into the background slowly, so objects present on the first frame leave no ghosts
+    FOREGROUND_LEARNING_RATE = 0.002
+    # share of the enclosing circle a blob has to fill, drops streaks and merged clusters
+    MINIMUM_FILL = 0.5
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.background = None
+        self.kernel = np.ones((3, 3), dtype=np.uint8)
+
+    def detect(self, gray, scale=1):
+        if self.background is None or self.background.shape != gray.shape:
+            self.background = gray.astype(np.float32)
+        difference = cv2.absdiff(gray, cv2.convertScaleAbs(self.background))
+        mask = cv2.threshold(difference, self.LEVEL, 255, cv2.THRESH_BINARY)[1]
+        cv2.accumulateWeighted(gray, self.background, self.LEARNING_RATE, cv2.bitwise_not(mask))
+        cv2.accumulateWeighted(gray, self.background, self.FOREGROUND_LEARNING_RATE, mask)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, self.kernel)
+        contours = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)[-2]
+        minimum_radius = self.settings.minimum_radius / scale
+        maximum_radius = self.settings.maximum_radius / scale
+        circles = []
+        for contour in contours:
+            (x, y), r = cv2.minEnclosingCircle(contour)
+            if r < minimum_radius or r > maximum_radius:
+                continue
+            if cv2.contourArea(contour) < self.MINIMUM_FILL * np.pi * r * r:
+                continue
+            circles.append((x, y, r))
+        if not circles:
+            return NO_CIRCLES
+        return np.array(circles, dtype=np.float32)
+
+
+ENGINES = {HOUGH: HoughDetector, CONTOURS: ContourDetector}
+
+
+# (x0, y0, x1, y1) boxes; overlapping ones are joined, a ball in the overlap would be found twice otherwise
+def merge_windows(windows):
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for x0, y0, x1, y1 in windows:
+            for box in result:
+                if x0 < box[2] and box[0] < x1 and y0 < box[3] and box[1] < y1:
+                    box[:] = min(x0, box[0]), min(y0, box[1]), max(x1, box[2]), max(y1, box[3])
+                    merged = True
+                    break
+            else:
+                result.append([x0, y0, x1, y1])
+        windows = result
+    return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in windows]
+
+
+# circles of neighbouring strips and the rows each strip owns; a circle closer than distance to one of the strip
+# above is the same ball seen from both sides of the border, only the ones near a border need to be compared
+def merge_circles(strips, owned, distance):
+    merged = [strips[0]]
+    for circles, (start, _) in zip(strips[1:], owned[1:]):
+        above = merged[-1]
+        above = above[above[:, 1] >= start - distance]
+        near = circles[:, 1] < start + distance
+        if len(above) and near.any():
+            dx = circles[near, None, 0] - above[None, :, 0]
+            dy = circles[near, None, 1] - above[None, :, 1]
+            duplicate = np.zeros(len(circles), dtype=bool)
+            duplicate[near] = (dx * dx + dy * dy < distance * distance).any(axis=1)
+            circles = circles[~duplicate]
+        merged.append(circles)
+    return np.concatenate(merged)
+
+
+class Detector:
+    MOTION_LEVEL = 25
+    # rows beyond the largest radius each strip also gets: the gradient kernel and the edge hysteresis
+    # following edges of touching balls reach past the circle itself
+    STRIP_PADDING = 10
+
+    def __init__(self, settings):
+        self.settings = settings
+        # one engine per region, engines with a background model must not see crops of other regions
+        self.engines = {}
+        self.engine_name = None
+        self.reference = None
+        self.detections = []
+        self.skipped = 0
+        self.local_frames = 0
+        self.pool = None
+        self.pool_size = 0
+
+    # with a tracker and detection_interval > 1 only every n-th frame is searched whole,
+    # the frames in between only around the positions the tracker predicts
+    def detect(self, gray, scale=1, tracker=None):
+        regions = self.regions(gray, scale)
+        if self.settings.motion_threshold > 0 and not self.has_motion(gray, regions):
+            self.skipped += 1
+            return self.detections
+        if self.full_frame(tracker):
+            searched = [(region, region) for region in regions]
+        else:
+            # Hough keeps no state, so one engine serves all windows
+            searched = [(window, None) for window in self.windows(tracker.predictions(), regions, scale)]
+        circles = []
+        for (x, y, w, h), key in searched:
+            if key is not None and self.settings.engine == HOUGH and self.settings.detection_threads > 1:
+                found = self.detect_tiled(gray[y:y + h, x:x + w], scale)
+            else:
+                found = self.engine(key).detect(gray[y:y + h, x:x + w], scale)
+            circles.append(found + np.array([x, y, 0], dtype=np.float32))
+        circles = np.concatenate(circles) if circles else NO_CIRCLES
+        # plain ints keep Tracker arithmetic identical whichever process produced the circles
+        circles = np.around(circles * scale).astype(np.int64)
+        # regions, windows and strips each list their own circles first, sorted by y then x the tracker
+        # gets the same list whichever way the frame was searched
+        circles = circles[np.lexsort((circles[:, 2], circles[:, 0], circles[:, 1]))]
+        self.detections = circles.tolist()
+        return self.detections
+
+    def full_frame(self, tracker):
+        # without active tracks there is nothing to search around, on the first frame as well as after losing all
+        if tracker is None or not tracker.active or self.settings.engine != HOUGH or \
+                self.local_frames + 1 >= self.settings.detection_interval:
+            self.local_frames = 0
+            return True
+        self.local_frames += 1
+        return False
+
+    # search windows (detection pixels) around predicted positions (native pixels), kept inside the regions
+    def windows(self, predictions, regions, scale=1):
+        windows = []
+        for px, py, reach in predictions:
+            x0, y0 = int((px - reach) / scale), int((py - reach) / scale)
+            x1, y1 = int(np.ceil((px + reach) / scale)), int(np.ceil((py + reach) / scale))
+            for x, y, w, h in regions:
+                box = max(x0, x), max(y0, y), min(x1, x + w), min(y1, y + h)
+                if box[2] > box[0] and box[3] > box[1]:
+                    windows.append(box)
+        return merge_windows(windows)
+
+    # one frame split into horizontal strips searched in parallel (OpenCV releases the GIL), for the latency of a
+    # single live frame; a strip is searched with the maximum radius around it, so each circle centered in it is
+    # found the same way as on the whole frame
+    def detect_tiled(self, gray, scale=1):
+        engine = self.engine(None)
+        strips = self.strips(gray.shape[0], scale)
+        if len(strips) < 2:
+            return engine.detect(gray, scale)
+        if self.pool_size != self.settings.detection_threads:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False)
+            self.pool_size = self.settings.detection_threads
+            self.pool = ThreadPoolExecutor(self.pool_size, thread_name_prefix='detection')
+        jobs = [self.pool.submit(engine.detect, gray[y0:y1], scale) for y0, y1, _, _ in strips]
+        found = []
+        for job, (y0, _, start, end) in zip(jobs, strips):
+            circles = job.result() + np.array([0, y0, 0], dtype=np.float32)
+            # the overlaps are searched twice, a circle belongs to the strip its center is in
+            found.append(circles[(circles[:, 1] >= start) & (circles[:, 1] < end)])
+        owned = [(start, end) for _, _, start, end in strips]
+        return merge_circles(found, owned, max(self.settings.minimum_center_distance / scale, 1))
+
+    # (first row, end row, first owned row, end owned row) per strip of an image of the given height
+    def strips(self, height, scale=1):
+        if self.settings.maximum_radius <= 0:
+            # HoughCircles has no radius limit then, so no overlap is safe
+            return [(0, height, 0, height)]
+        overlap = int(np.ceil(self.settings.maximum_radius / scale)) + self.STRIP_PADDING
+        # strips thinner than the overlap would search mostly rows of their neighbours
+        count = max(min(self.settings.detection_threads, height // overlap), 1)
+        bounds = [height * i // count for i in range(count + 1)]
+        return [(max(start - overlap, 0), min(end + overlap, height), start, end)
+                for start, end in zip(bounds[:-1], bounds[1:])]
+
+    # the strip threads end with the session, detect_tiled starts them again when needed
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.pool = None
+        self.pool_size = 0
+
+    def engine(self, region):
+        if self.engine_name != self.settings.engine:
+            self.engines = {}
+            self.engine_name = self.settings.engine
+        if region not in self.engines:
+            self.engines[region] = ENGINES[self.engine_name](self.settings)
+        return self.engines[region]
+
+    # regions of interest (native pixels) clipped to the detection image, the whole image when none are set
+    def regions(self, gray, scale=1):
+        height, width = gray.shape[:2]
+        if not self.settings.rois:
+            return [(0, 0, width, height)]
+        regions = []
+        for x, y, w, h in self.settings.rois:
+            x0, y0 = max(int(x / scale), 0), max(int(y / scale), 0)
+            x1, y1 = min(int(np.ceil((x + w) / scale)), width), min(int(np.ceil((y + h) / scale)), height)
+            if x1 > x0 and y1 > y0:
+                regions.append((x0, y0, x1 - x0, y1 - y0))
+        return regions
+
+    # compares with the last frame the engine ran on, so slow movement still adds up to a detection
+    def has_motion(self, gray, regions):
+        reference = self.reference
+        if reference is None or reference.shape != gray.shape:
+            self.reference = gray
+            return True
+        changed = 0
+        for x, y, w, h in regions:
+            difference = cv2.absdiff(gray[y:y + h, x:x + w], reference[y:y + h, x:x + w])
+            changed += cv2.countNonZero(cv2.threshold(difference, self.MOTION_LEVEL, 255, cv2.THRESH_BINARY)[1])
+        if changed < self.settings.motion_threshold:
+            return False
+        self.reference = gray
+        return True
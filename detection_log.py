@@ -0,0 +1,78 @@
+import numpy as np
+
+from tracker import *
+
+LOG_EXTENSION = '.dlog'
+MAGIC = b'DLOG0001'
+HEADER_SIZE = 16
+# one row per detection; a frame without detections still gets one row with r = -1, so replay sees it
+DETECTION_DTYPE = np.dtype([('frame', '<u4'), ('timestamp', '<f8'), ('x', '<i4'), ('y', '<i4'), ('r', '<i4')])
+
+
+# raw per-frame detections as they went into Tracker.update, so tracking can be re-run without video
+class DetectionLog:
+    def __init__(self, path, frequency=50, batch_size=4096):
+        self.path = path
+        self.batch_size = batch_size
+        self.rows = []
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + np.array([frequency], dtype='<f8').tobytes())
+
+    def add(self, frame_index, timestamp, detections):
+        if timestamp is None:
+            timestamp = np.nan
+        if not detections:
+            self.rows.append((frame_index, timestamp, 0, 0, -1))
+        for x, y, r in detections:
+            self.rows.append((frame_index, timestamp, x, y, r))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.file.write(np.array(self.rows, dtype=DETECTION_DTYPE).tobytes())
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+def load_detections(path):
+    with open(path, 'rb') as file:
+        header = file.read(HEADER_SIZE)
+    if header[:len(MAGIC)] != MAGIC:
+        raise IOError('Not a detection log ' + path)
+    frequency = float(np.frombuffer(header[len(MAGIC):], dtype='<f8')[0])
+    return np.fromfile(path, dtype=DETECTION_DTYPE, offset=HEADER_SIZE), frequency
+
+
+# (frame index, timestamp or None, [[x, y, r], ...]) in the order the frames were logged
+def iter_frames(rows):
+    if len(rows) == 0:
+        return
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(rows['frame'].astype(np.int64))) + 1, [len(rows)]))
+    frames = rows['frame'].tolist()
+    timestamps = rows['timestamp'].tolist()
+    # one conversion for the whole log, the frames are then plain list slices
+    detections = np.stack((rows['x'], rows['y'], rows['r']), axis=1).astype(np.int64).tolist()
+    for start, end in zip(starts[:-1].tolist(), starts[1:].tolist()):
+        timestamp = timestamps[start]
+        if timestamp != timestamp:
+            timestamp = None
+        found = detections[start:end]
+        if found[0][2] < 0:
+            found = []
+        yield frames[start], timestamp, found
+
+
+# feeds a log into a fresh tracker, so tracking settings can be changed without decoding or detecting again
+def replay_log(path, tracking_distance, assignment=GREEDY, prediction_gate=0, scaling_coefficient=1, writer=None):
+    rows, frequency = load_detections(path)
+    tracker = Tracker(tracking_distance, assignment, writer, prediction_gate=prediction_gate)
+    frames = 0
+    for _, timestamp, detections in iter_frames(rows):
+        tracker.update(detections, frequency, scaling_coefficient, timestamp)
+        frames += 1
+    tracker.close()
+    return tracker, frames, frequency
@@ -0,0 +1,79 @@
+import csv
+import queue
+import threading
+
+TRACKS_HEADER = ['id', 'frames', 'radius', 'distance', 'speed', 'terminal_speed']
+FRAMES_HEADER = ['frame', 'id', 'x', 'y', 'r']
+
+
+# same {id: (frames, radius, distance, speed, terminal speed)} layout as Tracker.for_processing; files written
+# before the terminal speed was exported load with 0 there
+def load_tracks(path):
+    tracks = {}
+    with open(path, 'r', newline='') as file:
+        reader = csv.reader(file)
+        next(reader)
+        for row in reader:
+            object_id, frames, radius, distance, speed = row[:5]
+            terminal_speed = float(row[5]) if len(row) > 5 else 0.0
+            tracks[int(object_id)] = (int(frames), int(radius), float(distance), float(speed), terminal_speed)
+    return tracks
+
+
+# rows are collected in batches on the caller's thread and written by a background thread,
+# so the frame loop never waits on the disk
+class TrackWriter:
+    def __init__(self, tracks_path, frames_path=None, batch_size=1000):
+        self.tracks_path = tracks_path
+        self.frames_path = frames_path
+        self.batch_size = batch_size
+        self.track_rows = []
+        self.frame_rows = []
+        self.track_count = 0
+        self.batches = queue.Queue(maxsize=64)
+        self.tracks_file = open(tracks_path, 'w', newline='')
+        csv.writer(self.tracks_file).writerow(TRACKS_HEADER)
+        self.frames_file = None
+        if frames_path is not None:
+            self.frames_file = open(frames_path, 'w', newline='')
+            csv.writer(self.frames_file).writerow(FRAMES_HEADER)
+        self.thread = threading.Thread(target=self.run, name='track writer', daemon=True)
+        self.thread.start()
+
+    def add_frame(self, frame_index, objects):
+        if self.frames_file is None:
+            return
+        for x, y, r, object_id in objects:
+            self.frame_rows.append((frame_index, object_id, x, y, r))
+        if len(self.frame_rows) >= self.batch_size:
+            self.batches.put((self.frames_file, self.frame_rows))
+            self.frame_rows = []
+
+    def add_track(self, object_id, summary):
+        self.track_rows.append((object_id,) + tuple(summary))
+        self.track_count += 1
+        if len(self.track_rows) >= self.batch_size:
+            self.batches.put((self.tracks_file, self.track_rows))
+            self.track_rows = []
+
+    def close(self):
+        if self.frame_rows:
+            self.batches.put((self.frames_file, self.frame_rows))
+        if self.track_rows:
+            self.batches.put((self.tracks_file, self.track_rows))
+        self.frame_rows = []
+        self.track_rows = []
+        self.batches.put(None)
+        self.thread.join()
+        self.tracks_file.close()
+        if self.frames_file is not None:
+            self.frames_file.close()
+
+    def run(self):
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                break
+            file, rows = batch
+            csv.writer(file).writerows(rows)
+            file.flush()
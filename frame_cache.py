@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+from detection import *
+
+CACHE_SIZE = 4 * 1024 ** 3
+# part of every key; 2: the frame rate is stored unrounded
+CACHE_VERSION = 2
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# zero copy: every frame is a view into the mapped file
+def load_frames(entry):
+    with open(entry + '.json', 'r') as file:
+        meta = json.load(file)
+    frames = np.memmap(entry + '.raw', dtype=np.uint8, mode='r', shape=tuple(meta['shape']))
+    return frames, meta['frequency'], meta['scale']
+
+
+class FrameCache:
+    def __init__(self, directory, max_bytes=CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    # prepared frames depend on the preprocessing as well as on the video, so both are in the key
+    def entry(self, video_path, width=DETECTION_WIDTH):
+        key = '%s_w%d_v%d' % (file_hash(video_path), width, CACHE_VERSION)
+        return os.path.join(self.directory, key)
+
+    def fetch(self, video_path, width=DETECTION_WIDTH):
+        entry = self.entry(video_path, width)
+        # an entry is complete with both files; a .json left without its .raw is stored again
+        if os.path.exists(entry + '.json') and os.path.exists(entry + '.raw'):
+            os.utime(entry + '.raw')
+        else:
+            self.store(video_path, entry, width)
+            self.evict(keep=entry)
+        return entry
+
+    def frames(self, video_path, width=DETECTION_WIDTH):
+        return load_frames(self.fetch(video_path, width))
+
+    def store(self, video_path, entry, width=DETECTION_WIDTH):
+        video = cv2.VideoCapture(video_path)
+        if not video.isOpened():
+            raise IOError('Can not open video ' + video_path)
+        frequency = video.get(cv2.CAP_PROP_FPS) or 50
+        count = 0
+        shape = (0, 0)
+        scale = 1
+        # written under temporary names, an interrupted run never leaves a truncated entry behind
+        with open(entry + '.raw.part', 'wb') as file:
+            while True:
+                ret, frame = video.read()
+                if not ret:
+                    break
+                gray, scale = prepare_frame(frame, width)
+                shape = gray.shape
+                file.write(gray.tobytes())
+                count += 1
+        video.release()
+        if count == 0:
+            os.remove(entry + '.raw.part')
+            raise IOError('No frames decoded from ' + video_path)
+        with open(entry + '.json.part', 'w') as file:
+            json.dump({'shape': [count, shape[0], shape[1]], 'frequency': frequency, 'scale': scale,
+                       'source': os.path.abspath(video_path)}, file)
+        os.replace(entry + '.raw.part', entry + '.raw')
+        os.replace(entry + '.json.part', entry + '.json')
+
+    # least recently used entries go first until the cache fits into max_bytes
+    def evict(self, keep=None):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.raw'):
+                continue
+            entry = os.path.join(self.directory, name[:-len('.raw')])
+            stat = os.stat(entry + '.raw')
+            entries.append((stat.st_mtime, stat.st_size, entry))
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if entry == keep:
+                continue
+            # the .json goes first, it is what marks an entry as present
+            for suffix in ('.json', '.raw'):
+                if os.path.exists(entry + suffix):
+                    os.remove(entry + suffix)
+            total -= size
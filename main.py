@@ -1,7 +1,8 @@
-from PyQt5.QtWidgets import QApplication
 import sys
 
-from view import *
+from PyQt5.QtWidgets import QApplication
+
+from view import View
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
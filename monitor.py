@@ -0,0 +1,118 @@
+import copy
+
+from PyQt5 import QtCore, QtWidgets, QtGui
+
+from export import *
+from sessions import *
+
+VIDEO_FILE = 'Video file...'
+COLUMNS = ['session', 'fps', 'received', 'processed', 'dropped', 'tracks']
+
+
+# several cameras or tubes measured at once; every session starts with a copy of the main window settings
+class Monitor(QtWidgets.QMainWindow):
+    def __init__(self, settings, parent=None):
+        super().__init__(parent)
+        self.settings = settings
+        self.manager = SessionManager()
+        self.session_count = 0
+
+        self.setWindowTitle('Sessions')
+        self.setFixedSize(600, 400)
+        self.setWindowIcon(QtGui.QIcon('icon.png'))
+
+        self.source_box = QtWidgets.QComboBox(self)
+        self.add_button = QtWidgets.QPushButton(self)
+        self.stop_button = QtWidgets.QPushButton(self)
+        self.table = QtWidgets.QTableWidget(self)
+        self.statusbar = QtWidgets.QStatusBar(self)
+        self.setStatusBar(self.statusbar)
+
+        self.status_timer = QtCore.QTimer(self)
+        self.status_timer.setInterval(500)
+        self.status_timer.timeout.connect(self.show_status)
+
+        self.setup_ui()
+
+    def setup_ui(self):
+        self.source_box.move(5, 5)
+        self.source_box.resize(300, 30)
+        try:
+            self.source_box.addItems(device_names())
+        except Exception as e:
+            print(e)
+        self.source_box.addItem(VIDEO_FILE)
+
+        self.add_button.move(310, 5)
+        self.add_button.resize(140, 30)
+        self.add_button.setText('Add session')
+        self.add_button.setStatusTip('Start a session on the selected source with the current detection settings')
+        self.add_button.clicked.connect(self.add_session)
+
+        self.stop_button.move(455, 5)
+        self.stop_button.resize(140, 30)
+        self.stop_button.setText('Stop session')
+        self.stop_button.setStatusTip('Stop the selected session and open its tracks in data processing')
+        self.stop_button.clicked.connect(self.stop_session)
+
+        self.table.move(0, 40)
+        self.table.resize(600, 340)
+        self.table.setColumnCount(len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().hide()
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
+
+    def add_session(self):
+        name = self.source_box.currentText()
+        try:
+            if name == VIDEO_FILE:
+                video_path = QtWidgets.QFileDialog.getOpenFileName(filter='Video (*.mov *.mp4)')
+                if not video_path[0]:
+                    return
+                source = ReplaySource(video_path[0], loop=False)
+                name = os.path.splitext(os.path.basename(video_path[0]))[0]
+            else:
+                source = open_source(self.source_box.currentIndex(), name)
+                name = os.path.basename(name).replace(' ', '_')
+            self.manager.add(Session('%d_%s' % (self.session_count, name), source, copy.copy(self.settings)))
+            self.session_count += 1
+        except Exception as e:
+            print(e)
+            self.statusbar.showMessage(str(e))
+        self.show_status()
+
+    def stop_session(self):
+        row = self.table.currentRow()
+        if row < 0 or row >= len(self.manager.sessions):
+            return
+        tracks_path = self.manager.remove(self.manager.sessions[row])
+        self.show_status()
+        parent = self.parent()
+        if parent is not None and hasattr(parent, 'show_processing'):
+            parent.show_processing(load_tracks(tracks_path))
+
+    def show_status(self):
+        rows = self.manager.status()
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            values = [row['name'], '%.1f' % row['fps'], row['received'], row['processed'], row['dropped'],
+                      row['tracks']]
+            for j, value in enumerate(values):
+                item = self.table.item(i, j)
+                if item is None:
+                    item = QtWidgets.QTableWidgetItem()
+                    self.table.setItem(i, j, item)
+                item.setText(str(value))
+        self.statusbar.showMessage('%d sessions on %d workers' % (len(rows), self.manager.workers))
+
+    # the workers only run while the window is open
+    def showEvent(self, event):
+        if not self.manager.running:
+            self.manager.start()
+        self.status_timer.start()
+
+    def closeEvent(self, event):
+        self.status_timer.stop()
+        self.manager.stop()
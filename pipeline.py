@@ -0,0 +1,127 @@
+import collections
+import threading
+
+BLOCK = 'block'
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+
+
+class FrameQueue:
+    def __init__(self, capacity, drop_policy=DROP_OLDEST):
+        self.capacity = capacity
+        self.drop_policy = drop_policy
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, item):
+        with self.condition:
+            if self.closed:
+                return False
+            self.received += 1
+            if len(self.items) >= self.capacity:
+                if self.drop_policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return False
+                if self.drop_policy == DROP_OLDEST:
+                    self.items.popleft()
+                    self.dropped += 1
+                else:
+                    self.condition.wait_for(lambda: len(self.items) < self.capacity or self.closed)
+                    if self.closed:
+                        self.dropped += 1
+                        return False
+            self.items.append(item)
+            self.condition.notify_all()
+            return True
+
+    # returns None on timeout or once the queue is closed and drained
+    def get(self, timeout=None):
+        with self.condition:
+            self.condition.wait_for(lambda: self.items or self.closed, timeout)
+            if not self.items:
+                return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.items)
+
+
+class LatestFrame:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.item = None
+        self.version = 0
+        self.taken_version = 0
+        self.overwritten = 0
+
+    def set(self, item):
+        with self.lock:
+            if self.version != self.taken_version:
+                self.overwritten += 1
+            self.item = item
+            self.version += 1
+
+    # returns None when nothing new arrived since the previous take
+    def take(self):
+        with self.lock:
+            if self.version == self.taken_version:
+                return None
+            self.taken_version = self.version
+            return self.item
+
+
+class FramePipeline:
+    def __init__(self, process, capacity=2, drop_policy=DROP_OLDEST):
+        self.process = process
+        self.frames = FrameQueue(capacity, drop_policy)
+        self.output = LatestFrame()
+        self.processed = 0
+        self.thread = threading.Thread(target=self.run, name='detection', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    # remaining queued frames are still processed before the worker exits
+    def stop(self):
+        self.frames.close()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    # the timestamp (seconds) travels with the frame, so dropped frames do not distort speeds
+    def submit(self, frame, timestamp=None):
+        return self.frames.put((frame, timestamp))
+
+    # true when the detection thread is not keeping up with the frames submitted
+    def behind(self):
+        return len(self.frames) >= self.frames.capacity
+
+    def latest(self):
+        return self.output.take()
+
+    def run(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            try:
+                result = self.process(*item)
+            except Exception as e:
+                print(e)
+                continue
+            self.processed += 1
+            self.output.set(result)
+
+    def status(self):
+        return 'received %d | processed %d | dropped %d | not displayed %d' % (
+            self.frames.received, self.processed, self.frames.dropped, self.output.overwritten)
@@ -1,4 +1,96 @@
-from PyQt5 import QtWidgets, QtGui
+import numpy as np
+from PyQt5 import QtCore, QtWidgets, QtGui
+
+from viscosity import *
+
+ENABLED_COLUMN = 6
+SPEED_COLUMNS = {'average speed': 4, 'terminal speed': 5}
+
+
+# rows are only formatted when the view paints them, so thousands of tracks cost a few arrays instead of widgets
+class TracksModel(QtCore.QAbstractTableModel):
+    HEADERS = ['id', 'frames', 'radius', 'distance', 'avg. speed', 'term. speed', 'use']
+
+    def __init__(self, data: dict, parent=None):
+        super().__init__(parent)
+        # columns: id, frames, radius, distance, speed, terminal speed; very slow tracks are standing noise
+        # and are left out
+        rows = [(key,) + tuple(value) for key, value in data.items() if value[3] > 0.1]
+        self.values = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        self.scaled = self.values
+        self.enabled = np.ones(len(self.values), dtype=bool)
+        self.order = np.arange(len(self.values))
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.values)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def flags(self, index):
+        flags = QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        if index.column() == ENABLED_COLUMN:
+            flags |= QtCore.Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.order[index.row()]
+        column = index.column()
+        if column == ENABLED_COLUMN:
+            if role == QtCore.Qt.CheckStateRole:
+                return QtCore.Qt.Checked if self.enabled[row] else QtCore.Qt.Unchecked
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            value = self.scaled[row, column]
+            if column < 2:
+                return '%d' % value
+            return '%.2f' % value
+        if role == QtCore.Qt.TextAlignmentRole:
+            return QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter
+        if role == QtCore.Qt.ForegroundRole and not self.enabled[row]:
+            return QtGui.QBrush(QtCore.Qt.gray)
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid() or index.column() != ENABLED_COLUMN or role != QtCore.Qt.CheckStateRole:
+            return False
+        self.enabled[self.order[index.row()]] = value == QtCore.Qt.Checked
+        self.dataChanged.emit(self.index(index.row(), 0), self.index(index.row(), ENABLED_COLUMN))
+        return True
+
+    # radius, distance and speeds are converted together, the table only repaints the visible rows
+    def set_scale(self, coefficient):
+        self.scaled = self.values * np.array([1, 1, coefficient, coefficient, coefficient, coefficient])
+        if len(self.values) > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.values) - 1, ENABLED_COLUMN - 1))
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        if len(self.values) == 0:
+            return
+        self.layoutAboutToBeChanged.emit()
+        old_order = self.order
+        keys = self.enabled if column == ENABLED_COLUMN else self.scaled[:, column]
+        self.order = np.argsort(keys, kind='stable')
+        if order == QtCore.Qt.DescendingOrder:
+            self.order = self.order[::-1]
+        # selected rows follow their tracks to the new positions
+        positions = np.empty_like(self.order)
+        positions[self.order] = np.arange(len(self.order))
+        persistent = self.persistentIndexList()
+        self.changePersistentIndexList(persistent, [
+            self.index(int(positions[old_order[index.row()]]), index.column()) for index in persistent])
+        self.layoutChanged.emit()
+
+    # unscaled (id, frames, radius, distance, speed, terminal speed) rows still enabled for the calculations
+    def enabled_tracks(self):
+        return self.values[self.enabled]
 
 
 class Processing(QtWidgets.QMainWindow):
@@ -12,6 +104,7 @@ class Processing(QtWidgets.QMainWindow):
         self.setWindowIcon(QtGui.QIcon('icon.png'))
 
         self.calculate_button = QtWidgets.QPushButton(self)
+        self.speed_box = QtWidgets.QComboBox(self)
 
         self.pix_spinbox = QtWidgets.QSpinBox(self)
         self.pix_label = QtWidgets.QLabel(self)
@@ -26,31 +119,46 @@ class Processing(QtWidgets.QMainWindow):
         self.objects_density_label = QtWidgets.QLabel(self)
         self.objects_density_spinbox = QtWidgets.QDoubleSpinBox(self)
 
-        self.legend_label = QtWidgets.QLabel(self)
+        self.model = TracksModel(data, self)
+        self.table = QtWidgets.QTableView(self)
 
         self.statusbar = QtWidgets.QStatusBar(self)
         self.setStatusBar(self.statusbar)
+        self.result_label = QtWidgets.QLabel(self)
+        self.statusbar.addPermanentWidget(self.result_label)
 
         self.setup_ui()
 
-        self.formLayout = QtWidgets.QFormLayout(self)
-        self.groupBox = QtWidgets.QGroupBox(self)
-        self.scroll = QtWidgets.QScrollArea(self)
-
         self.update_scale()
 
-        self.pix_spinbox.setValue(scaling_pix)
+        # the calibration distance is measured between clicked points, a float
+        self.pix_spinbox.setValue(int(round(scaling_pix)))
         self.mm_spinbox.setValue(scaling_mm)
 
+        # the estimate is cheap enough to follow every change of the inputs
+        self.pix_spinbox.valueChanged.connect(self.calculate_coefficient)
+        self.mm_spinbox.valueChanged.connect(self.calculate_coefficient)
+        self.fluid_density_spinbox.valueChanged.connect(self.calculate_coefficient)
+        self.speed_box.currentTextChanged.connect(self.calculate_coefficient)
+        self.objects_density_spinbox.valueChanged.connect(self.calculate_coefficient)
+        self.model.dataChanged.connect(self.calculate_coefficient)
+        self.calculate_coefficient()
+
     def setup_ui(self):
         self.calculate_button.move(5, 30)
         self.calculate_button.setText('Calculate')
         self.calculate_button.resize(100, 50)
         self.calculate_button.clicked.connect(self.calculate_coefficient)
 
+        self.speed_box.move(5, 90)
+        self.speed_box.resize(150, 25)
+        self.speed_box.addItems(list(SPEED_COLUMNS))
+        self.speed_box.setStatusTip('Mean speed over the whole track, or the slope over its last half '
+                                    '(terminal speed, once the object stopped accelerating)')
+
         self.pix_spinbox.move(120, 30)
         self.pix_spinbox.setMinimum(1)
-        self.pix_spinbox.setMaximum(1920)
+        self.pix_spinbox.setMaximum(10000)
 
         self.pix_label.move(150, 50)
         self.pix_label.setText('pixels')
@@ -90,9 +198,17 @@ class Processing(QtWidgets.QMainWindow):
         self.objects_density_spinbox.setValue(1.05)
         self.fluid_density_spinbox.setStatusTip('Density in g/cm^3 (г/см^3)')
 
-        self.legend_label.move(10, 130)
-        self.legend_label.resize(1000, 20)
-        self.legend_label.setText('id | frames | radius | distance | avg.speed)')
+        self.table.move(0, 130)
+        self.table.resize(500, 670)
+        self.table.setModel(self.model)
+        self.table.setSortingEnabled(True)
+        self.table.sortByColumn(0, QtCore.Qt.AscendingOrder)
+        self.table.setSelectionBehavior(QtWidgets.QAbstractItemView.SelectRows)
+        self.table.verticalHeader().hide()
+        # fixed row heights keep the view from measuring every row
+        self.table.verticalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Fixed)
+        self.table.verticalHeader().setDefaultSectionSize(22)
+        self.table.horizontalHeader().setSectionResizeMode(QtWidgets.QHeaderView.Stretch)
 
     def closeEvent(self, event):
         for widget in QtWidgets.QApplication.topLevelWidgets():
@@ -100,31 +216,19 @@ class Processing(QtWidgets.QMainWindow):
                 widget.show()
 
     def update_scale(self):
-        for i in reversed(range(self.formLayout.count())):
-            self.formLayout.itemAt(i).widget().setParent(None)
-        for key, value in self.data.items():
-            if value[3] <= 0.1:
-                continue
-            if self.checkbox.isChecked():
-                scaling_coefficient = self.mm_spinbox.value() / self.pix_spinbox.value()
-                label1 = QtWidgets.QLabel(
-                    str('%-4.4s %-12.12s %-10.10s %-12.2f %-11.2f' % (
-                        key, value[0], value[1] * scaling_coefficient, value[2] * scaling_coefficient,
-                        value[3] * scaling_coefficient)))
-            else:
-                label1 = QtWidgets.QLabel(
-                    str('%-4.4s %-12.12s %-10.10s %-12.2f %-11.2f' % (key, value[0], value[1], value[2], value[3])))
-            button = QtWidgets.QPushButton(self)
-            button.setText('Disable in calculations')
-            self.formLayout.addRow(label1, button)
-        self.groupBox.setLayout(self.formLayout)
-        self.scroll.setWidget(self.groupBox)
-        self.scroll.setWidgetResizable(True)
-        layout = QtWidgets.QVBoxLayout(self)
-        layout.addWidget(self.scroll)
-
-        self.scroll.move(0, 150)
-        self.scroll.resize(500, 650)
+        if self.checkbox.isChecked():
+            self.model.set_scale(self.mm_spinbox.value() / self.pix_spinbox.value())
+        else:
+            self.model.set_scale(1)
 
     def calculate_coefficient(self):
-        layout.addWidget(self.scroll)
+        tracks = self.model.enabled_tracks()
+        result = estimate(tracks[:, 2], tracks[:, SPEED_COLUMNS[self.speed_box.currentText()]],
+                          self.fluid_density_spinbox.value(),
+                          self.objects_density_spinbox.value(),
+                          self.mm_spinbox.value() / self.pix_spinbox.value())
+        if result.count == 0:
+            self.result_label.setText('No tracks in calculations')
+            return
+        self.result_label.setText('Viscosity %.4g Pa*s (%d%%: %.4g - %.4g), median %.4g, %d tracks' % (
+            result.mean, CONFIDENCE * 100, result.low, result.high, result.median, result.count))
@@ -0,0 +1,67 @@
+import collections
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# laps are cheap enough to leave in the frame path: when disabled each call is a single attribute check
+class Profiler:
+    def __init__(self, window=500, trace_size=200000):
+        self.enabled = False
+        self.window = window
+        self.samples = {}
+        self.trace = collections.deque(maxlen=trace_size)
+        self.origin = time.perf_counter()
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def set_enabled(self, value):
+        self.enabled = value
+
+    def start(self):
+        if not self.enabled:
+            return
+        self.local.last = time.perf_counter()
+
+    # time since the previous start()/lap() on the same thread is booked to the stage
+    def lap(self, name):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        last = getattr(self.local, 'last', None)
+        self.local.last = now
+        if last is None:
+            return
+        with self.lock:
+            if name not in self.samples:
+                self.samples[name] = collections.deque(maxlen=self.window)
+            self.samples[name].append(now - last)
+            self.trace.append((name, last, now - last, threading.get_ident()))
+
+    def percentiles(self, q=(50, 90, 99)):
+        with self.lock:
+            samples = {name: np.array(values) for name, values in self.samples.items() if values}
+        return {name: np.percentile(values, q) * 1000 for name, values in samples.items()}
+
+    def summary(self):
+        return ' | '.join('%s %.1f/%.1f ms' % (name, values[0], values[1])
+                          for name, values in self.percentiles((50, 90)).items())
+
+    def clear(self):
+        with self.lock:
+            self.samples = {}
+            self.trace.clear()
+
+    # Chrome tracing / Perfetto "complete" events, timestamps in microseconds
+    def dump_trace(self, path):
+        with self.lock:
+            trace = list(self.trace)
+        pid = os.getpid()
+        events = [{'name': name, 'cat': 'frame', 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6}
+                  for name, start, duration, tid in trace]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
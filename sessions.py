@@ -0,0 +1,241 @@
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+
+from capture import *
+from detection import *
+from detection_log import *
+from export import *
+from settings import *
+from tracker import *
+
+RESULTS_DIRECTORY = 'results'
+
+
+# one capture -> detect -> track chain with its own settings and result files; frames wait in a small
+# ring of the newest ones until the manager hands the session to a worker
+class Session:
+    def __init__(self, name, source, settings, results_directory=RESULTS_DIRECTORY, capacity=2):
+        self.name = name
+        self.source = source
+        self.settings = settings
+        self.results_directory = results_directory
+        self.capacity = capacity
+        self.frames = collections.deque()
+        self.manager = None
+        self.busy = False
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.done = collections.deque(maxlen=50)
+        self.detector = Detector(settings)
+        self.tracker = None
+        self.writer = None
+        self.log = None
+
+    # the source knows its frame rate only once it is open, so it starts first and the session is not
+    # handed to a worker until the log and tracker exist
+    def start(self):
+        self.source.start(self.submit)
+        os.makedirs(self.results_directory, exist_ok=True)
+        name = os.path.join(self.results_directory, '%s_%s' % (self.name, time.strftime('%Y-%m-%d_%H-%M-%S')))
+        self.writer = TrackWriter(name + '.tracks.csv', name + '.frames.csv')
+        self.log = DetectionLog(name + LOG_EXTENSION, self.source.frequency)
+        tracker = Tracker(self.settings.tracking_distance, self.settings.assignment, self.writer,
+                          prediction_gate=self.settings.prediction_gate, log=self.log)
+        with self.manager.condition:
+            self.tracker = tracker
+            self.manager.condition.notify_all()
+
+    @property
+    def ready(self):
+        return bool(self.frames) and not self.busy and self.tracker is not None
+
+    # called from the capture thread
+    def submit(self, frame, timestamp=None):
+        with self.manager.condition:
+            self.received += 1
+            if len(self.frames) >= self.capacity:
+                self.frames.popleft()
+                self.dropped += 1
+            self.frames.append((frame, timestamp))
+            self.manager.condition.notify()
+
+    # called by one worker at a time, so detection and tracking of a session stay in frame order
+    def process(self, frame, timestamp):
+        gray, scale = prepare_frame(frame, self.settings.detection_width)
+        detections = self.detector.detect(gray, scale, self.tracker)
+        self.tracker.update(detections, self.source.frequency, 1, timestamp)
+        self.processed += 1
+        self.done.append(time.perf_counter())
+
+    @property
+    def fps(self):
+        if len(self.done) < 2 or self.done[-1] == self.done[0]:
+            return 0
+        return (len(self.done) - 1) / (self.done[-1] - self.done[0])
+
+    @property
+    def finished(self):
+        return not self.source.running and not self.frames and not self.busy
+
+    # returns the path of the tracks file once everything captured so far is processed
+    def stop(self):
+        self.source.stop()
+        with self.manager.condition:
+            self.manager.condition.wait_for(lambda: not self.frames and not self.busy or not self.manager.running)
+        self.tracker.close()
+        self.writer.close()
+        self.log.close()
+        self.detector.close()
+        return self.writer.tracks_path
+
+    def status(self):
+        return {'name': self.name, 'received': self.received, 'processed': self.processed,
+                'dropped': self.dropped, 'fps': self.fps, 'tracks': self.tracker.object_count if self.tracker else 0}
+
+
+# all sessions share one pool of worker threads (OpenCV releases the GIL); workers serve the sessions
+# round robin, so a fast camera can not starve a slow one
+class SessionManager:
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.sessions = []
+        self.condition = threading.Condition()
+        self.next = 0
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        self.running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.run, name='session worker %d' % i, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        for session in list(self.sessions):
+            self.remove(session)
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    # a session whose source fails to open is never listed
+    def add(self, session):
+        session.manager = self
+        session.start()
+        with self.condition:
+            self.sessions.append(session)
+            self.condition.notify_all()
+        return session
+
+    def remove(self, session):
+        tracks_path = session.stop()
+        with self.condition:
+            self.sessions.remove(session)
+        return tracks_path
+
+    # the first session after the one served last that has a frame and is not being processed
+    def take(self):
+        count = len(self.sessions)
+        for offset in range(count):
+            index = (self.next + offset) % count
+            session = self.sessions[index]
+            if session.ready:
+                self.next = index + 1
+                session.busy = True
+                return session, session.frames.popleft()
+        return None
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: not self.running or self.take_ready())
+                if not self.running:
+                    return
+                session, item = self.take()
+            try:
+                session.process(*item)
+            except Exception as e:
+                print(e)
+            with self.condition:
+                session.busy = False
+                self.condition.notify_all()
+
+    def take_ready(self):
+        return any(session.ready for session in self.sessions)
+
+    def status(self):
+        with self.condition:
+            return [session.status() for session in self.sessions]
+
+
+def format_status(rows):
+    return '\n'.join('%-16s %7.1f fps | received %d | processed %d | dropped %d | tracks %d' % (
+        row['name'], row['fps'], row['received'], row['processed'], row['dropped'], row['tracks']) for row in rows)
+
+
+def create_source(name, rate=None):
+    if name == 'synthetic':
+        return open_source(0, SYNTHETIC, rate)
+    if name.startswith('/dev/video') or name.isdigit():
+        return VideoCaptureSource(int(name[len('/dev/video'):]) if name.startswith('/dev/') else int(name))
+    # files are played once at their own rate, like a camera would deliver them
+    return ReplaySource(name, rate, loop=False)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Several capture, detection and tracking sessions in one process')
+    parser.add_argument('sources', nargs='+', help='video file, camera (/dev/videoN or index) or "synthetic"')
+    parser.add_argument('-s', '--settings', nargs='+', default=[SETTINGS_FILE],
+                        help='settings file per source, the last one is used for the remaining sources')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='shared worker threads')
+    parser.add_argument('--rate', type=float, help='replay rate of files and synthetic sources (fps)')
+    parser.add_argument('--duration', type=float, help='stop after this many seconds')
+    parser.add_argument('-o', '--output', default=RESULTS_DIRECTORY, help='directory for the result files')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    manager = SessionManager(args.workers)
+    manager.start()
+    start = time.perf_counter()
+    failed = []
+    try:
+        for i, source in enumerate(args.sources):
+            settings = Settings()
+            settings_path = args.settings[min(i, len(args.settings) - 1)]
+            try:
+                settings.load(settings_path)
+            except Exception as e:
+                print(str(e) + '(file settings incorrect, defaults are used)', file=sys.stderr)
+            name = '%d_%s' % (i, os.path.splitext(os.path.basename(source))[0])
+            # a source that can not be opened is skipped, the other sessions still run
+            try:
+                manager.add(Session(name, create_source(source, args.rate), settings, args.output))
+            except Exception as e:
+                print('%s skipped: %s' % (source, e), file=sys.stderr)
+                failed.append(source)
+        while not all(session.finished for session in manager.sessions):
+            if args.duration is not None and time.perf_counter() - start > args.duration:
+                break
+            time.sleep(1)
+            print(format_status(manager.status()) + '\n')
+    except KeyboardInterrupt:
+        pass
+    finally:
+        rows = manager.status()
+        manager.stop()
+    print(format_status(rows))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,77 @@
+from detection import HOUGH
+from tracker import GREEDY
+
+SETTINGS_FILE = 'settings.txt'
+
+
+class Settings:
+    def __init__(self):
+        self.resolution_scale = 1
+        self.minimum_center_distance = 20
+        self.param1 = 50
+        self.param2 = 30
+        self.minimum_radius = 1
+        self.maximum_radius = 50
+        self.tracking_distance = 25
+        self.assignment = GREEDY
+        self.rois = []
+        self.motion_threshold = 0
+        self.detection_width = 800
+        self.engine = HOUGH
+        self.prediction_gate = 0
+        self.detection_interval = 1
+        self.frame_skipping = False
+        self.detection_threads = 1
+
+    def save(self, path=SETTINGS_FILE):
+        file = open(path, 'w')
+        file.write(str(self.resolution_scale) + '\n')
+        file.write(str(self.minimum_center_distance) + '\n')
+        file.write(str(self.param1) + '\n')
+        file.write(str(self.param2) + '\n')
+        file.write(str(self.minimum_radius) + '\n')
+        file.write(str(self.maximum_radius) + '\n')
+        file.write(str(self.tracking_distance) + '\n')
+        file.write(self.assignment + '\n')
+        file.write(';'.join(','.join(str(value) for value in roi) for roi in self.rois) + '\n')
+        file.write(str(self.motion_threshold) + '\n')
+        file.write(str(self.detection_width) + '\n')
+        file.write(self.engine + '\n')
+        file.write(str(self.prediction_gate) + '\n')
+        file.write(str(self.detection_interval) + '\n')
+        file.write(str(int(self.frame_skipping)) + '\n')
+        file.write(str(self.detection_threads) + '\n')
+        file.close()
+
+    def load(self, path=SETTINGS_FILE):
+        file = open(path, 'r')
+        if not file:
+            return
+        lines = file.read().splitlines()
+        file.close()
+        self.resolution_scale = float(lines[0])
+        self.minimum_center_distance = int(lines[1])
+        self.param1 = int(lines[2])
+        self.param2 = float(lines[3])
+        self.minimum_radius = int(lines[4])
+        self.maximum_radius = int(lines[5])
+        self.tracking_distance = int(lines[6])
+        # values added later are optional, so older settings files keep loading
+        if len(lines) > 7:
+            self.assignment = lines[7]
+        if len(lines) > 8:
+            self.rois = [tuple(int(value) for value in roi.split(',')) for roi in lines[8].split(';') if roi]
+        if len(lines) > 9:
+            self.motion_threshold = int(lines[9])
+        if len(lines) > 10:
+            self.detection_width = int(lines[10])
+        if len(lines) > 11:
+            self.engine = lines[11]
+        if len(lines) > 12:
+            self.prediction_gate = int(lines[12])
+        if len(lines) > 13:
+            self.detection_interval = int(lines[13])
+        if len(lines) > 14:
+            self.frame_skipping = bool(int(lines[14]))
+        if len(lines) > 15:
+            self.detection_threads = int(lines[15])
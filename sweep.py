@@ -0,0 +1,150 @@
+import argparse
+import copy
+import itertools
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+from detection import *
+from frame_cache import *
+from settings import *
+from tracker import *
+
+PARAMETERS = ['resolution_scale', 'minimum_center_distance', 'param1', 'param2', 'minimum_radius', 'maximum_radius']
+
+clip = None
+clip_frequency = 50
+clip_scale = 1
+
+
+def load_clip(video_path, first_frame, frame_count, width, cache=None):
+    if cache is not None:
+        frames, frequency, scale = cache.frames(video_path, width)
+        if first_frame >= len(frames):
+            raise IOError('No frames decoded from ' + video_path)
+        return np.array(frames[first_frame:first_frame + frame_count]), frequency, scale
+    video = cv2.VideoCapture(video_path)
+    if not video.isOpened():
+        raise IOError('Can not open video ' + video_path)
+    frequency = video.get(cv2.CAP_PROP_FPS) or 50
+    if first_frame > 0:
+        video.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    frames = []
+    scale = 1
+    while len(frames) < frame_count:
+        ret, frame = video.read()
+        if not ret:
+            break
+        gray, scale = prepare_frame(frame, width)
+        frames.append(gray)
+    video.release()
+    if not frames:
+        raise IOError('No frames decoded from ' + video_path)
+    return np.stack(frames), frequency, scale
+
+
+def init_worker(frames, frequency, scale):
+    global clip, clip_frequency, clip_scale
+    clip = frames
+    clip_frequency = frequency
+    clip_scale = scale
+
+
+def parameter_grid(ranges):
+    for values in itertools.product(*(ranges[name] for name in PARAMETERS)):
+        parameters = dict(zip(PARAMETERS, values))
+        if parameters['minimum_radius'] < parameters['maximum_radius']:
+            yield parameters
+
+
+# a good setting finds the same number of balls on every frame and keeps them on the same tracks:
+# stability falls with the relative spread of the per frame count, continuity is the share of detections
+# that extended an existing track instead of starting a new one
+def score(counts, track_count):
+    mean = counts.mean()
+    if mean == 0:
+        return 0, 0, 0
+    stability = 1 / (1 + counts.std() / mean)
+    continuity = 1 - track_count / counts.sum()
+    return stability * continuity, stability, continuity
+
+
+def evaluate(base_settings, parameters):
+    settings = copy.copy(base_settings)
+    for name, value in parameters.items():
+        setattr(settings, name, value)
+    # one grid point per process already
+    settings.detection_threads = 1
+    detector = Detector(settings)
+    tracker = Tracker(settings.tracking_distance, settings.assignment, prediction_gate=settings.prediction_gate)
+    counts = np.zeros(len(clip))
+    for i, gray in enumerate(clip):
+        detections = detector.detect(gray, clip_scale, tracker)
+        tracker.update(detections, clip_frequency, 1)
+        counts[i] = len(detections)
+    return parameters, score(counts, tracker.object_count)
+
+
+def sweep(frames, frequency, scale, base_settings, ranges, workers):
+    grid = list(parameter_grid(ranges))
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(frames, frequency, scale)) as executor:
+        results = list(executor.map(evaluate, itertools.repeat(base_settings), grid,
+                                    chunksize=max(1, len(grid) // (workers * 8))))
+    results.sort(key=lambda result: result[1][0], reverse=True)
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description='Grid search of HoughCircles settings on a short clip')
+    parser.add_argument('video', help='path to .mov/.mp4 file')
+    parser.add_argument('-s', '--settings', default=SETTINGS_FILE, help='settings file, best values are written back')
+    parser.add_argument('--start', type=int, default=0, help='first frame of the clip')
+    parser.add_argument('--frames', type=int, default=100, help='clip length in frames')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--cache', help='directory for decoded frames, reused by later runs on the same file')
+    parser.add_argument('--dry-run', action='store_true', help='only print the ranking')
+    parser.add_argument('--resolution-scale', type=float, nargs='+', default=[1, 1.5, 2])
+    parser.add_argument('--minimum-center-distance', type=int, nargs='+', default=[10, 20, 40])
+    parser.add_argument('--param1', type=int, nargs='+', default=[30, 50, 100])
+    parser.add_argument('--param2', type=float, nargs='+', default=[15, 20, 30])
+    parser.add_argument('--minimum-radius', type=int, nargs='+', default=[1, 5, 10])
+    parser.add_argument('--maximum-radius', type=int, nargs='+', default=[30, 50, 80])
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    settings = Settings()
+    try:
+        settings.load(args.settings)
+    except Exception as e:
+        print(str(e) + '(file settings incorrect, defaults are used)', file=sys.stderr)
+
+    start = time.perf_counter()
+    cache = FrameCache(args.cache) if args.cache else None
+    frames, frequency, scale = load_clip(args.video, args.start, args.frames, settings.detection_width, cache)
+    ranges = {name: getattr(args, name) for name in PARAMETERS}
+    results = sweep(frames, frequency, scale, settings, ranges, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print('%d settings on %d frames in %.1f s' % (len(results), len(frames), elapsed))
+    print('score | stability | continuity | ' + ' | '.join(PARAMETERS))
+    for parameters, (total, stability, continuity) in results[:5]:
+        print('%.3f | %.3f | %.3f | ' % (total, stability, continuity) +
+              ' | '.join(str(parameters[name]) for name in PARAMETERS))
+
+    if results and not args.dry_run:
+        for name, value in results[0][0].items():
+            setattr(settings, name, value)
+        settings.save(args.settings)
+        print('best values saved to ' + args.settings)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,16 +1,190 @@
 import math
 
+import numpy as np
+
+from viscosity import fitted_speed
+
+GREEDY = 'greedy'
+OPTIMAL = 'optimal'
+
+HISTORY_LENGTH = 256
+
+
+# one record per track, updated in place; the trajectory is a fixed ring buffer of (seconds, cx, cy, r)
+class Track:
+    __slots__ = ('object_id', 'cx', 'cy', 'vx', 'vy', 'start_time', 'last_time', 'radius', 'frames', 'distance',
+                 'speed', 'scaled_speed', 'history', 'history_count', 'listed')
+
+    def __init__(self, history):
+        self.history = history
+        self.reset(0, 0, 0, 0, 0)
+
+    def reset(self, object_id, cx, cy, radius, time):
+        self.object_id = object_id
+        self.cx = cx
+        self.cy = cy
+        # constant velocity in pixels per time unit (see Tracker.time), known after the first move
+        self.vx = 0
+        self.vy = 0
+        self.start_time = time
+        self.last_time = time
+        self.radius = radius
+        self.frames = 0
+        self.distance = 0
+        self.speed = 0
+        self.scaled_speed = 0
+        self.history_count = 0
+        self.listed = -1
+
+    def record(self, seconds, cx, cy, r):
+        self.history[self.history_count % len(self.history)] = (seconds, cx, cy, r)
+        self.history_count += 1
+
+    # oldest point first, at most the last len(history) points
+    def trajectory(self):
+        length = len(self.history)
+        if self.history_count <= length:
+            return self.history[:self.history_count].copy()
+        start = self.history_count % length
+        return np.concatenate((self.history[start:], self.history[:start]))
+
+    # the terminal speed is fitted while the history is still there, the writer and for_processing get it
+    # with the summary
+    def summary(self):
+        return self.frames, self.radius, self.distance, self.speed, fitted_speed(self.trajectory())
+
 
 class Tracker:
-    def __init__(self, tracking_distance):
+    # with a writer, per-frame objects and finished tracks are streamed out and finished track records are
+    # recycled, so memory stays flat however long the session runs; without one finished tracks that moved are
+    # kept with their trimmed history
+    def __init__(self, tracking_distance, assignment=GREEDY, writer=None, history_length=HISTORY_LENGTH,
+                 prediction_gate=0, log=None):
         self.tracking_distance = tracking_distance
+        self.assignment = assignment
+        # > 0: moving tracks are matched within this distance of the predicted position instead of
+        # tracking_distance around the last one, so fast objects do not need a wide gate
+        self.prediction_gate = prediction_gate
+        self.writer = writer
+        # a DetectionLog records the raw detections of every frame for replay_log
+        self.log = log
+        self.history_length = history_length
         self.object_count = 0
-        self.previous_frame_data = {}
-        self.tracked_objects = {}
-        self.for_processing = {}
+        self.frame_index = 0
+        # seconds when update() gets timestamps, the frame index otherwise
+        self.time = 0
+        # capture time in seconds, derived from the frame index without timestamps; trajectories use it
+        self.seconds = 0
+        self.step = 1
+        self.timestamps = False
+        # active tracks in the order the previous frame found them, which is the greedy match priority
+        self.active = []
+        self.next_active = []
+        self.found_tracks = []
+        self.finished = {}
+        self.spare = []
+
+    # {id: (frames, radius, distance, speed, terminal speed)} of every kept track that moved at least once
+    @property
+    def for_processing(self):
+        tracks = {}
+        for track in list(self.finished.values()) + self.active:
+            if track.frames > 0:
+                tracks[track.object_id] = track.summary()
+        return tracks
+
+    # where the tracks of the last frame should be now: (x, y, reach) in detection coordinates,
+    # reach is the radius plus the gate a detection has to fall into
+    def predictions(self):
+        predictions = []
+        # the next frame is expected one step after the last one
+        time = self.time + self.step
+        for track in self.active:
+            px, py, gate = self.predict(track, time)
+            # track positions carry the historical +r/2 offset of the center, detections do not
+            predictions.append((px - track.radius / 2, py - track.radius / 2, track.radius + gate))
+        return predictions
+
+    def predict(self, track, time):
+        if self.prediction_gate > 0 and track.frames > 0:
+            elapsed = time - track.last_time
+            return track.cx + track.vx * elapsed, track.cy + track.vy * elapsed, self.prediction_gate
+        return track.cx, track.cy, self.tracking_distance
+
+    def trajectory(self, object_id):
+        for track in self.active:
+            if track.object_id == object_id:
+                return track.trajectory()
+        return self.finished[object_id].trajectory()
+
+    # timestamp: capture or decode time of the frame in seconds; with it speeds follow the real elapsed time
+    # and stay right when frames are dropped or skipped, without it every frame is assumed to be 1/frequency apart
+    def update(self, detected_objects, frequency, scaling_coefficient, timestamp=None):
+        if self.log is not None:
+            self.log.add(self.frame_index, timestamp, detected_objects)
+        self.timestamps = timestamp is not None
+        time = timestamp if self.timestamps else self.frame_index
+        if self.frame_index > 0 and time > self.time:
+            self.step = time - self.time
+        self.time = time
+        self.seconds = timestamp if self.timestamps else self.frame_index / frequency
+        self.found_tracks.clear()
+        if self.assignment == OPTIMAL:
+            found_objects = self.match_optimal(detected_objects, frequency, scaling_coefficient)
+        else:
+            found_objects = self.match_greedy(detected_objects, frequency, scaling_coefficient)
+
+        # the two active lists are swapped every frame instead of building new containers
+        next_active = self.next_active
+        next_active.clear()
+        for track in self.found_tracks:
+            if track.listed != self.frame_index:
+                track.listed = self.frame_index
+                next_active.append(track)
 
-    def update(self, detected_objects, frequency, scaling_coefficient):
+        if self.writer is not None:
+            self.writer.add_frame(self.frame_index, found_objects)
+        for track in self.active:
+            if track.listed != self.frame_index:
+                self.finish_track(track)
+
+        self.next_active = self.active
+        self.active = next_active
+        self.frame_index += 1
+
+        return found_objects
+
+    def finish_track(self, track):
+        if self.writer is None:
+            if track.frames == 0:
+                # never moved, so for_processing skips it; the record is reused like with a writer
+                self.spare.append(track)
+                return
+            # only the recorded part of the history is kept, a finished track does not grow any more
+            track.history = track.trajectory()
+            track.history_count = len(track.history)
+            self.finished[track.object_id] = track
+            return
+        if track.frames > 0:
+            self.writer.add_track(track.object_id, track.summary())
+        self.spare.append(track)
+
+    # hands the still active tracks to the writer at the end of a session
+    def close(self):
+        if self.writer is None:
+            return
+        for track in self.active:
+            self.finish_track(track)
+        self.active.clear()
+
+    def match_greedy(self, detected_objects, frequency, scaling_coefficient):
         found_objects = []
+        # tracks started in this frame are appended, so later detections can match them as well
+        candidates = self.active
+        # predict() inlined, this loop runs for every detection and track pair
+        predicting = self.prediction_gate > 0
+        tracking_distance = self.tracking_distance
+        time = self.time
 
         for detected_object in detected_objects:
             x, y, r = detected_object
@@ -19,45 +193,129 @@ class Tracker:
 
             same_object = False
 
-            for object_id, object_data in self.previous_frame_data.items():
-                dist = math.hypot(cx - object_data[0], cy - object_data[1])
-                if dist < self.tracking_distance:
-                    if r - 3 >= self.tracked_objects[object_id][1]:
+            for track in candidates:
+                dist = math.hypot(cx - track.cx, cy - track.cy)
+                if predicting and track.frames > 0:
+                    elapsed = time - track.last_time
+                    inside = math.hypot(cx - track.cx - track.vx * elapsed,
+                                        cy - track.cy - track.vy * elapsed) < self.prediction_gate
+                else:
+                    inside = dist < tracking_distance
+                if inside:
+                    if r - 3 >= track.radius:
                         break
-                    found_objects.append([x, y, r, object_id])
-                    self.previous_frame_data[object_id] = (cx, cy)
-                    frames, radius, distance, speed = self.tracked_objects[object_id]
-                    frames += 1
-                    self.tracked_objects[object_id] = (
-                        frames,
-                        radius,
-                        distance + dist,
-                        scaling_coefficient * distance / (frames / frequency)
-                    )
-                    self.for_processing[object_id] = (
-                        frames,
-                        radius,
-                        distance + dist,
-                        distance / (frames / frequency)
-                    )
+                    found_objects.append([x, y, r, track.object_id])
+                    self.move_track(track, cx, cy, r, dist, frequency, scaling_coefficient)
                     same_object = True
-                    print(self.tracked_objects)
                     break
 
             if not same_object:
-                self.previous_frame_data[self.object_count] = (cx, cy)
-                self.tracked_objects[self.object_count] = (0, r, 0, 0)
-                found_objects.append([x, y, r, self.object_count])
-                self.object_count += 1
+                track = self.add_track(cx, cy, r)
+                candidates.append(track)
+                found_objects.append([x, y, r, track.object_id])
+
+        return found_objects
+
+    # candidate pairs come from a KD-tree query and only the contested ones go through the Hungarian method,
+    # so close objects can not steal each other's id the way the first-come greedy match does
+    def match_optimal(self, detected_objects, frequency, scaling_coefficient):
+        # scipy takes longer to import than the rest of the program, greedy matching never needs it
+        from scipy.spatial import cKDTree
+        detections = np.array(detected_objects, dtype=np.int64).reshape(-1, 3)
+        centers = (detections[:, :2] * 2 + detections[:, 2:]) // 2
+        tracks = self.active
+        predictions = np.array([self.predict(track, self.time) for track in tracks], dtype=np.float64).reshape(-1, 3)
+        radii = np.array([track.radius for track in tracks], dtype=np.int64)
 
-        new_previous_frame_data = {}
-        new_tracked_objects = {}
-        for found_object in found_objects:
-            _, _, _, object_id = found_object
-            new_previous_frame_data[object_id] = self.previous_frame_data[object_id]
-            new_tracked_objects[object_id] = self.tracked_objects[object_id]
+        matches = {}
+        if len(detections) > 0 and len(tracks) > 0:
+            gates = predictions[:, 2]
+            pairs = cKDTree(centers).sparse_distance_matrix(
+                cKDTree(predictions[:, :2]), gates.max(), output_type='ndarray')
+            rows, columns, distances = pairs['i'], pairs['j'], pairs['v']
+            allowed = (distances < gates[columns]) & (detections[rows, 2] - 3 < radii[columns])
+            rows, columns, distances = rows[allowed], columns[allowed], distances[allowed]
 
-        self.previous_frame_data = new_previous_frame_data.copy()
-        self.tracked_objects = new_tracked_objects.copy()
+            row_counts = np.bincount(rows, minlength=len(detections))
+            column_counts = np.bincount(columns, minlength=len(tracks))
+            unique = (row_counts[rows] == 1) & (column_counts[columns] == 1)
+            for i, j, dist in zip(rows[unique].tolist(), columns[unique].tolist(), distances[unique].tolist()):
+                matches[i] = (j, dist)
+
+            contested = ~unique
+            if contested.any():
+                matches.update(self.assign(rows[contested], columns[contested], distances[contested]))
+
+        found_objects = []
+        new_tracks = []
+        for i, detected_object in enumerate(detected_objects):
+            x, y, r = detected_object
+            cx, cy = centers[i].tolist()
+            if i in matches:
+                j, dist = matches[i]
+                track = tracks[j]
+                if self.prediction_gate > 0:
+                    # the match distance is to the prediction, the travelled one is to the last position
+                    dist = math.hypot(cx - track.cx, cy - track.cy)
+                self.move_track(track, cx, cy, r, dist, frequency, scaling_coefficient)
+            else:
+                track = self.add_track(cx, cy, r)
+                new_tracks.append(track)
+            found_objects.append([x, y, r, track.object_id])
+        tracks.extend(new_tracks)
 
         return found_objects
+
+    def assign(self, rows, columns, distances):
+        from scipy.optimize import linear_sum_assignment
+        row_keys, row_index = np.unique(rows, return_inverse=True)
+        column_keys, column_index = np.unique(columns, return_inverse=True)
+        # a penalty above any possible sum of allowed distances maximises the number of matches first
+        penalty = (distances.max() + 1) * (min(len(row_keys), len(column_keys)) + 1)
+        cost = np.full((len(row_keys), len(column_keys)), penalty, dtype=np.float64)
+        cost[row_index, column_index] = distances
+        allowed = np.zeros(cost.shape, dtype=bool)
+        allowed[row_index, column_index] = True
+
+        matches = {}
+        for i, j in zip(*linear_sum_assignment(cost)):
+            if allowed[i, j]:
+                matches[int(row_keys[i])] = (int(column_keys[j]), float(cost[i, j]))
+        return matches
+
+    # records of finished tracks are reused once the writer has their data, so a new track allocates nothing
+    def add_track(self, cx, cy, r):
+        if self.spare:
+            track = self.spare.pop()
+        else:
+            # float64, camera timestamps are large enough for float32 to round them to milliseconds
+            track = Track(np.zeros((self.history_length, 4), dtype=np.float64))
+        track.reset(self.object_count, cx, cy, r, self.time)
+        track.record(self.seconds, cx, cy, r)
+        self.found_tracks.append(track)
+        self.object_count += 1
+        return track
+
+    def move_track(self, track, cx, cy, r, dist, frequency, scaling_coefficient):
+        elapsed = self.time - track.last_time
+        if elapsed > 0:
+            track.vx = (cx - track.cx) / elapsed
+            track.vy = (cy - track.cy) / elapsed
+        track.cx = cx
+        track.cy = cy
+        track.last_time = self.time
+        track.record(self.seconds, cx, cy, r)
+        self.found_tracks.append(track)
+        distance = track.distance
+        track.frames += 1
+        track.distance = distance + dist
+        if self.timestamps:
+            # the whole distance over the time it took, skipped or dropped frames do not bias it
+            distance = track.distance
+            duration = self.time - track.start_time
+        else:
+            # the frame count formula divides the distance before this step, kept so results stay comparable
+            duration = track.frames / frequency
+        if duration > 0:
+            track.scaled_speed = scaling_coefficient * distance / duration
+            track.speed = distance / duration
@@ -1,11 +1,52 @@
 from PyQt5 import QtWidgets, QtCore, QtGui
-from pygrabber.dshow_graph import FilterGraph
+import os
+import time
 import cv2
 import numpy as np
-import qimage2ndarray
-from multipledispatch import dispatch
+from detection import *
+from export import *
+from detection_log import *
+from settings import *
 from tracker import *
-from processing import *
+from capture import *
+from pipeline import *
+from profiling import *
+
+
+RESULTS_DIRECTORY = 'results'
+
+
+class FrameLabel(QtWidgets.QLabel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.frame = None
+        self.image = None
+        self.profiler = None
+
+    # the QImage only wraps the array buffer, so the array is kept alive for as long as it is shown
+    def set_frame(self, frame):
+        height, width = frame.shape[:2]
+        image_format = QtGui.QImage.Format_Grayscale8 if frame.ndim == 2 else QtGui.QImage.Format_BGR888
+        self.image = QtGui.QImage(frame.data, width, height, frame.strides[0], image_format)
+        self.frame = frame
+        self.update()
+
+    def clear_frame(self):
+        self.frame = None
+        self.image = None
+
+    # scaled straight from the frame buffer, there is no intermediate pixmap
+    def paintEvent(self, event):
+        if self.image is None:
+            super().paintEvent(event)
+            return
+        if self.profiler is not None:
+            self.profiler.start()
+        painter = QtGui.QPainter(self)
+        painter.drawImage(self.rect(), self.image)
+        painter.end()
+        if self.profiler is not None:
+            self.profiler.lap('paint')
 
 
 # noinspection PyUnresolvedReferences
@@ -15,36 +56,41 @@ class View(QtWidgets.QMainWindow):
 
         self.setWindowModality(QtCore.Qt.ApplicationModal)
 
-        self.resolution_scale = 1
-        self.minimum_center_distance = 20
-        self.param1 = 50
-        self.param2 = 30
-        self.minimum_radius = 1
-        self.maximum_radius = 50
-        self.tracking_distance = 25
+        self.settings = Settings()
 
         self.frequency = 50
 
-        self.graph = FilterGraph()
+        self.capture = None
+        self.monitor = None
         self.camera_thread = QtCore.QThread(self)
-        self.camera_timer = QtCore.QTimer(self.camera_thread)
         self.camera_connected = False
         self.camera_only = False
-        self.tracker = Tracker(self.tracking_distance)
+        self.pipeline = None
+        self.display_timer = QtCore.QTimer(self)
+        self.status_timer = QtCore.QTimer(self)
+        self.profiler = Profiler()
 
         self.scaling_pos1 = QtCore.QPoint(0, 0)
         self.scaling_pos2 = QtCore.QPoint(0, 0)
         self.scaling_distance = 0
+        self.scaling_mm = 0
+        self.gray_output = False
+        self.skipped_frames = 0
+        self.roi_pos1 = None
+        self.frame_size = (800, 450)
 
         try:
             self.load_from_settings()
         except Exception as e:
             print(str(e) + '(file settings incorrect)')
 
+        self.detector = Detector(self.settings)
+        self.tracker = self.create_tracker()
+
         self.menubar = QtWidgets.QMenuBar(self)
         self.statusbar = QtWidgets.QStatusBar(self)
 
-        self.image_label = QtWidgets.QLabel(self)
+        self.image_label = FrameLabel(self)
 
         self.camera_list_box = QtWidgets.QComboBox(self)
         self.camera_refresh_button = QtWidgets.QPushButton(self)
@@ -58,53 +104,74 @@ class View(QtWidgets.QMainWindow):
         self.Param2 = QtWidgets.QDoubleSpinBox(self)
         self.MinRadius1 = QtWidgets.QSpinBox(self)
         self.MaxRadius1 = QtWidgets.QSpinBox(self)
+        self.motion_threshold_box = QtWidgets.QSpinBox(self)
+        self.detection_width_box = QtWidgets.QSpinBox(self)
+        self.detector_engine_box = QtWidgets.QComboBox(self)
+        self.prediction_gate_box = QtWidgets.QSpinBox(self)
+        self.detection_interval_box = QtWidgets.QSpinBox(self)
 
         self.tracking_distance_box = QtWidgets.QSpinBox(self)
+        self.optimal_matching_box = QtWidgets.QCheckBox(self)
 
         self.scaling_value_box = QtWidgets.QDoubleSpinBox(self)
 
         self.setup_ui()
 
-        self.update_camera_list()
+        # DirectShow enumeration takes a while, the window is shown first and the list filled afterwards
+        QtCore.QTimer.singleShot(0, self.update_camera_list)
 
     # region Utils region
     def save_to_settings(self):
-        file = open('settings.txt', 'w')
-        file.write(str(self.resolution_scale) + '\n')
-        file.write(str(self.minimum_center_distance) + '\n')
-        file.write(str(self.param1) + '\n')
-        file.write(str(self.param2) + '\n')
-        file.write(str(self.minimum_radius) + '\n')
-        file.write(str(self.maximum_radius) + '\n')
-        file.write(str(self.tracking_distance) + '\n')
-        file.close()
+        self.settings.save()
 
     def load_from_settings(self):
-        file = open('settings.txt', 'r')
-        if not file:
-            return
-        self.resolution_scale = float(file.readline())
-        self.minimum_center_distance = int(file.readline())
-        self.param1 = int(file.readline())
-        self.param2 = float(file.readline())
-        self.minimum_radius = int(file.readline())
-        self.maximum_radius = int(file.readline())
-        self.tracking_distance = int(file.readline())
-        file.close()
+        self.settings.load()
 
     # endregion
 
     # region UI region
     def mousePressEvent(self, a0: QtGui.QMouseEvent):
+        if a0.modifiers() & QtCore.Qt.ControlModifier:
+            self.select_roi(a0)
+            return
         if a0.button() == 1:
             self.scaling_pos1 = a0.pos()
         elif a0.button() == 2:
             self.scaling_pos2 = a0.pos()
-        self.scaling_distance = np.sqrt(
-            (self.scaling_pos2.x() - self.scaling_pos1.x()) ** 2 + (self.scaling_pos2.y() - self.scaling_pos1.y()) ** 2)
+        x1, y1 = self.frame_position(self.scaling_pos1)
+        x2, y2 = self.frame_position(self.scaling_pos2)
+        self.scaling_distance = np.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
+
+    # window position -> pixel of the native frame shown in image_label
+    def frame_position(self, pos):
+        pos = self.image_label.mapFrom(self, pos)
+        return (pos.x() * self.frame_size[0] / self.image_label.width(),
+                pos.y() * self.frame_size[1] / self.image_label.height())
+
+    # ctrl + left click marks one corner of a region of interest, ctrl + right click the opposite one
+    def select_roi(self, a0: QtGui.QMouseEvent):
+        x, y = self.frame_position(a0.pos())
+        x, y = int(x), int(y)
+        if a0.button() == 1:
+            self.roi_pos1 = (x, y)
+        elif a0.button() == 2 and self.roi_pos1 is not None:
+            x0, y0 = self.roi_pos1
+            roi = (min(x0, x), min(y0, y), abs(x - x0), abs(y - y0))
+            if roi[2] > 0 and roi[3] > 0:
+                # replaced rather than appended in place, the detection thread may be iterating the list
+                self.settings.rois = self.settings.rois + [roi]
+            self.roi_pos1 = None
+
+    def clear_rois(self):
+        self.settings.rois = []
+        self.roi_pos1 = None
 
     def closeEvent(self, event):
         self.disconnect_camera()
+        if self.monitor is not None:
+            # sessions still running get their tracks and logs written before the program ends
+            self.monitor.manager.stop()
+            self.monitor.close()
         self.save_to_settings()
 
     def setup_ui(self):
@@ -121,6 +188,7 @@ class View(QtWidgets.QMainWindow):
         self.image_label.resize(800, 450)
         self.image_label.setScaledContents(True)
         self.image_label.setStatusTip('Here will be displayed processed video')
+        self.image_label.profiler = self.profiler
         self.set_image()
 
         self.camera_list_box.move(810, 25)
@@ -149,12 +217,13 @@ class View(QtWidgets.QMainWindow):
         self.GrayCheckBox.move(955, 101)
         self.GrayCheckBox.resize(50, 20)
         self.GrayCheckBox.setStatusTip('Output in gray or normal')
+        self.GrayCheckBox.toggled.connect(lambda checked: self.set_gray_output(checked))
         # =============================
         self.DP.move(810, 125)
         self.DP.resize(185, 20)
         self.DP.setMinimum(1)
         self.DP.setMaximum(10)
-        self.DP.setValue(self.resolution_scale)
+        self.DP.setValue(self.settings.resolution_scale)
         self.DP.setSingleStep(0.05)
         self.DP.valueChanged.connect(lambda value: self.set_resolution_scale(value))
         self.DP.setStatusTip('Resolution scale (1 - native, 2 - half)')
@@ -163,7 +232,7 @@ class View(QtWidgets.QMainWindow):
         self.MinDist.resize(185, 20)
         self.MinDist.setMinimum(1)
         self.MinDist.setMaximum(500)
-        self.MinDist.setValue(self.minimum_center_distance)
+        self.MinDist.setValue(self.settings.minimum_center_distance)
         self.MinDist.setSingleStep(1)
         self.MinDist.valueChanged.connect(lambda value: self.set_minimum_center_distance(value))
         self.MinDist.setStatusTip('Minimum center distance between circles (in pixels)')
@@ -172,7 +241,7 @@ class View(QtWidgets.QMainWindow):
         self.Param1.resize(185, 20)
         self.Param1.setMinimum(1)
         self.Param1.setMaximum(1000)
-        self.Param1.setValue(self.param1)
+        self.Param1.setValue(self.settings.param1)
         self.Param1.setSingleStep(1)
         self.Param1.valueChanged.connect(lambda value: self.update_param1_value(value))
         self.Param1.setStatusTip('PARAM1 LABEL')
@@ -181,7 +250,7 @@ class View(QtWidgets.QMainWindow):
         self.Param2.resize(185, 20)
         self.Param2.setMinimum(0.01)
         self.Param2.setMaximum(30)
-        self.Param2.setValue(self.param2)
+        self.Param2.setValue(self.settings.param2)
         self.Param2.setSingleStep(1)
         self.Param2.valueChanged.connect(lambda value: self.update_param2_value(value))
         self.Param2.setStatusTip('PARAM2 LABEL')
@@ -190,7 +259,7 @@ class View(QtWidgets.QMainWindow):
         self.MinRadius1.resize(185, 20)
         self.MinRadius1.setMinimum(1)
         self.MinRadius1.setMaximum(5000)
-        self.MinRadius1.setValue(self.minimum_radius)
+        self.MinRadius1.setValue(self.settings.minimum_radius)
         self.MinRadius1.setSingleStep(1)
         self.MinRadius1.valueChanged.connect(lambda value: self.set_minimum_radius(value))
         self.MinRadius1.setStatusTip('Minimum radius of circle (in pixels)')
@@ -199,25 +268,84 @@ class View(QtWidgets.QMainWindow):
         self.MaxRadius1.resize(185, 20)
         self.MaxRadius1.setMinimum(1)
         self.MaxRadius1.setMaximum(5000)
-        self.MaxRadius1.setValue(self.maximum_radius)
+        self.MaxRadius1.setValue(self.settings.maximum_radius)
         self.MaxRadius1.setSingleStep(1)
         self.MaxRadius1.valueChanged.connect(lambda value: self.set_maximum_radius(value))
         self.MaxRadius1.setStatusTip('Maximum radius of circle (in pixels)')
         # =============================
+        self.motion_threshold_box.move(810, 275)
+        self.motion_threshold_box.resize(185, 20)
+        self.motion_threshold_box.setMinimum(0)
+        self.motion_threshold_box.setMaximum(100000)
+        self.motion_threshold_box.setValue(self.settings.motion_threshold)
+        self.motion_threshold_box.setSingleStep(10)
+        self.motion_threshold_box.valueChanged.connect(lambda value: self.set_motion_threshold(value))
+        self.motion_threshold_box.setStatusTip('Changed pixels needed to run detection (0 - always detect)')
+        # =============================
+        self.detection_width_box.move(810, 300)
+        self.detection_width_box.resize(185, 20)
+        self.detection_width_box.setMinimum(0)
+        self.detection_width_box.setMaximum(7680)
+        self.detection_width_box.setValue(self.settings.detection_width)
+        self.detection_width_box.setSingleStep(80)
+        self.detection_width_box.valueChanged.connect(lambda value: self.set_detection_width(value))
+        self.detection_width_box.setStatusTip('Width of the image circles are searched on (0 - native resolution)')
+
+        self.detector_engine_box.move(810, 325)
+        self.detector_engine_box.resize(185, 20)
+        self.detector_engine_box.addItems(list(ENGINES))
+        self.detector_engine_box.setCurrentText(self.settings.engine)
+        self.detector_engine_box.currentTextChanged.connect(lambda value: self.set_detector_engine(value))
+        self.detector_engine_box.setStatusTip('Hough circles, or moving blobs on a static background (fixed camera)')
+
+        self.prediction_gate_box.move(810, 350)
+        self.prediction_gate_box.resize(185, 20)
+        self.prediction_gate_box.setMinimum(0)
+        self.prediction_gate_box.setMaximum(5000)
+        self.prediction_gate_box.setValue(self.settings.prediction_gate)
+        self.prediction_gate_box.valueChanged.connect(lambda value: self.set_prediction_gate(value))
+        self.prediction_gate_box.setStatusTip('Match distance around the predicted position (0 - no prediction)')
+
+        self.detection_interval_box.move(810, 375)
+        self.detection_interval_box.resize(185, 20)
+        self.detection_interval_box.setMinimum(1)
+        self.detection_interval_box.setMaximum(1000)
+        self.detection_interval_box.setValue(self.settings.detection_interval)
+        self.detection_interval_box.valueChanged.connect(lambda value: self.set_detection_interval(value))
+        self.detection_interval_box.setStatusTip('Search the whole frame every n-th frame, only around '
+                                                 'predicted positions in between (Hough only)')
+        # =============================
         self.scaling_value_box.move(810, 455)
         self.scaling_value_box.resize(185, 20)
         self.scaling_value_box.setMinimum(0)
         self.scaling_value_box.setMaximum(500)
         self.scaling_value_box.setStatusTip('Value in millimeters (used for calibration)')
+        self.scaling_value_box.valueChanged.connect(lambda value: self.set_scaling_mm(value))
         # =============================
         self.tracking_distance_box.move(810, 430)
         self.tracking_distance_box.resize(185, 20)
         self.tracking_distance_box.setMinimum(1)
         self.tracking_distance_box.setMaximum(5000)
         self.tracking_distance_box.setSingleStep(1)
-        self.tracking_distance_box.setValue(self.tracking_distance)
+        self.tracking_distance_box.setValue(self.settings.tracking_distance)
         self.tracking_distance_box.valueChanged.connect(lambda value: self.set_tracking_distance(value))
         self.tracking_distance_box.setStatusTip('Tracking distance (in pixels)')
+        # =============================
+        self.optimal_matching_box.move(810, 405)
+        self.optimal_matching_box.resize(185, 20)
+        self.optimal_matching_box.setText('Optimal matching')
+        self.optimal_matching_box.setChecked(self.settings.assignment == OPTIMAL)
+        self.optimal_matching_box.toggled.connect(lambda checked: self.set_optimal_matching(checked))
+        self.optimal_matching_box.setStatusTip('Match all objects of a frame at once instead of first found')
+
+        # repainting faster than the screen refreshes would only burn frames nobody sees
+        screen = QtGui.QGuiApplication.primaryScreen()
+        refresh_rate = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else 60
+        self.display_timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.display_timer.setInterval(max(1, int(1000 / refresh_rate)))
+        self.display_timer.timeout.connect(self.show_latest_frame)
+        self.status_timer.setInterval(250)
+        self.status_timer.timeout.connect(self.show_status)
 
     def setup_menubar(self):
         self.menubar.setGeometry(QtCore.QRect(0, 0, 1000, 20))
@@ -228,8 +356,60 @@ class View(QtWidgets.QMainWindow):
         file_action.setStatusTip('Load video file')
         file_action.triggered.connect(lambda: self.load_from_file())
 
+        results_action = QtWidgets.QAction('Open results', self)
+        results_action.setShortcut('Alt+2')
+        results_action.setStatusTip('Open saved track results in data processing')
+        results_action.triggered.connect(lambda: self.open_results())
+
+        retrack_action = QtWidgets.QAction('Re-track detections', self)
+        retrack_action.setShortcut('Alt+3')
+        retrack_action.setStatusTip('Track a saved detection log again with the current tracking settings')
+        retrack_action.triggered.connect(lambda: self.retrack())
+
+        replay_action = QtWidgets.QAction('Replay file as camera', self)
+        replay_action.setStatusTip('Play a video file at its frame rate through the live camera path')
+        replay_action.triggered.connect(lambda: self.replay_file())
+
+        skipping_action = QtWidgets.QAction('Skip frames when behind', self)
+        skipping_action.setCheckable(True)
+        skipping_action.setChecked(self.settings.frame_skipping)
+        skipping_action.setStatusTip('Keep video files in real time by leaving frames out of detection')
+        skipping_action.toggled.connect(lambda checked: self.set_frame_skipping(checked))
+
+        tiled_action = QtWidgets.QAction('Tiled detection on all cores', self)
+        tiled_action.setCheckable(True)
+        tiled_action.setChecked(self.settings.detection_threads > 1)
+        tiled_action.setStatusTip('Search strips of every frame in parallel, for lower live latency (Hough only)')
+        tiled_action.toggled.connect(lambda checked: self.set_tiled_detection(checked))
+
         file = self.menubar.addMenu('File')
-        file.addActions({file_action})
+        file.addActions([file_action, results_action, retrack_action, replay_action, skipping_action, tiled_action])
+
+        clear_roi_action = QtWidgets.QAction('Clear regions of interest', self)
+        clear_roi_action.setStatusTip('Detect on the whole frame (Ctrl + left/right click on video to add a region)')
+        clear_roi_action.triggered.connect(lambda: self.clear_rois())
+
+        roi = self.menubar.addMenu('Regions')
+        roi.addActions({clear_roi_action})
+
+        timings_action = QtWidgets.QAction('Show stage timings', self)
+        timings_action.setCheckable(True)
+        timings_action.setStatusTip('Measure every processing stage (median/90th percentile in status bar)')
+        timings_action.toggled.connect(lambda checked: self.set_profiling(checked))
+
+        trace_action = QtWidgets.QAction('Save trace', self)
+        trace_action.setStatusTip('Save measured stages for chrome://tracing or Perfetto')
+        trace_action.triggered.connect(lambda: self.save_trace())
+
+        profiling = self.menubar.addMenu('Profiling')
+        profiling.addActions([timings_action, trace_action])
+
+        monitor_action = QtWidgets.QAction('Session monitor', self)
+        monitor_action.setStatusTip('Measure several cameras or files at once with shared workers')
+        monitor_action.triggered.connect(lambda: self.open_monitor())
+
+        sessions = self.menubar.addMenu('Sessions')
+        sessions.addActions([monitor_action])
 
     # endregion
 
@@ -239,72 +419,201 @@ class View(QtWidgets.QMainWindow):
         video_path = QtWidgets.QFileDialog.getOpenFileName(filter='Video (*.mov *.mp4)')
         if video_path[0]:
             self.camera_connected = True
+            video = cv2.VideoCapture(video_path[0])
+            self.frequency = video.get(cv2.CAP_PROP_FPS) or 50
+            video.release()
+            # every frame of a file is analysed, so the reader waits instead of dropping
+            self.start_pipeline(BLOCK)
             self.camera_thread.started.connect(lambda: self.process_video(video_path))
             self.camera_thread.start()
 
     def process_video(self, video_path):
         video = cv2.VideoCapture(video_path[0])
-        self.frequency = int(video.get(cv2.CAP_PROP_FPS))
+        self.skipped_frames = 0
+        start = time.perf_counter()
+        position = 0
         while self.camera_connected and not self.camera_only:
+            late = position < time.perf_counter() - start
+            if self.settings.frame_skipping and late and self.pipeline.behind():
+                # grab() only advances the stream, the frame is never converted or sent to detection;
+                # speeds stay right because every submitted frame carries its own timestamp
+                if not video.grab():
+                    break
+                position = video.get(cv2.CAP_PROP_POS_MSEC) / 1000
+                self.skipped_frames += 1
+                continue
             ret, frame = video.read()
             if not ret:
                 break
-            self.set_image(frame)
-            cv2.waitKey(1000 // 25)
+            position = video.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            self.pipeline.submit(frame, position)
+            # played at the file's own rate; once detection falls behind there is no waiting at all
+            delay = position - (time.perf_counter() - start)
+            if delay > 0:
+                time.sleep(delay)
         video.release()
 
-    @dispatch()
-    def set_image(self):
+    def create_tracker(self, writer=None, log=None):
+        return Tracker(self.settings.tracking_distance, self.settings.assignment, writer,
+                       prediction_gate=self.settings.prediction_gate, log=log)
+
+    # every session streams its tracks to disk, only the still active ones are kept in memory;
+    # the raw detections go to a log that Re-track replays with other tracking settings
+    def start_session(self):
+        os.makedirs(RESULTS_DIRECTORY, exist_ok=True)
+        name = os.path.join(RESULTS_DIRECTORY, time.strftime('%Y-%m-%d_%H-%M-%S'))
+        writer = TrackWriter(name + '.tracks.csv', name + '.frames.csv')
+        self.tracker = self.create_tracker(writer, DetectionLog(name + LOG_EXTENSION, self.frequency))
+
+    def finish_session(self):
+        self.detector.close()
+        tracks = self.tracker.for_processing
+        if self.tracker.writer is not None:
+            self.tracker.close()
+            self.tracker.writer.close()
+            tracks = load_tracks(self.tracker.writer.tracks_path)
+        if self.tracker.log is not None:
+            self.tracker.log.close()
+        self.tracker = self.create_tracker()
+        return tracks
+
+    def open_results(self):
+        results_path = QtWidgets.QFileDialog.getOpenFileName(directory=RESULTS_DIRECTORY, filter='Tracks (*.csv)')
+        if results_path[0]:
+            self.disconnect_camera()
+            self.show_processing(load_tracks(results_path[0]))
+
+    def retrack(self):
+        log_path = QtWidgets.QFileDialog.getOpenFileName(directory=RESULTS_DIRECTORY,
+                                                         filter='Detections (*%s)' % LOG_EXTENSION)
+        if log_path[0]:
+            self.disconnect_camera()
+            start = time.perf_counter()
+            tracker, frames, _ = replay_log(log_path[0], self.settings.tracking_distance, self.settings.assignment,
+                                            self.settings.prediction_gate)
+            self.statusbar.showMessage('%d frames re-tracked in %.2f s' % (frames, time.perf_counter() - start))
+            self.show_processing(tracker.for_processing)
+
+    def open_monitor(self):
+        if self.monitor is None:
+            # the monitor pulls in the session machinery, most runs never open it
+            from monitor import Monitor
+            self.monitor = Monitor(self.settings, self)
+        self.monitor.show()
+
+    def show_processing(self, tracks):
+        if len(tracks) > 0:
+            self.hide()
+            from processing import Processing
+            dialog = Processing(parent=self,
+                                data=tracks,
+                                scaling_pix=self.scaling_distance,
+                                scaling_mm=self.scaling_value_box.value())
+            dialog.show()
+
+    # a camera knows its frame rate only once it is open, so it starts before the session that logs the rate;
+    # its first frames wait in the queue until the detection thread starts
+    def start_pipeline(self, drop_policy, capture=None):
+        self.pipeline = FramePipeline(self.process_frame, capacity=2, drop_policy=drop_policy)
+        if capture is not None:
+            capture.start(self.pipeline.submit)
+            self.capture = capture
+            self.frequency = capture.frequency
+        self.start_session()
+        self.pipeline.start()
+        self.display_timer.start()
+        self.status_timer.start()
+
+    def stop_pipeline(self):
+        self.display_timer.stop()
+        self.status_timer.stop()
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            self.pipeline = None
+
+    # without a frame the label is cleared to grey
+    def set_image(self, img=None):
+        if img is not None:
+            self.show_frame(self.process_frame(img))
+            return
+        self.image_label.clear_frame()
         pixmap = QtGui.QPixmap(self.image_label.size())
         pixmap.fill(QtGui.QColor('grey'))
         self.image_label.setPixmap(pixmap)
 
-    # todo: refactor
-    @dispatch(np.ndarray)
-    def set_image(self, img):
-        img = cv2.resize(img, (800, 450))  # !!!
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        gray = cv2.blur(gray, (3, 3))
-        circles = cv2.HoughCircles(
-            gray,
-            cv2.HOUGH_GRADIENT,
-            self.resolution_scale,
-            self.minimum_center_distance,
-            param1=self.param1,
-            param2=self.param2,
-            minRadius=int(self.minimum_radius),
-            maxRadius=int(self.maximum_radius)
-        )
-        detections = []
-        if circles is not None:
-            circles = np.uint16(np.around(circles))
-            for pt in circles[0, :]:
-                x, y, r = pt[0], pt[1], pt[2]
-                detections.append([x, y, r])
+    # runs on the detection thread, so it must not touch widgets
+    def process_frame(self, img, timestamp=None):
+        self.profiler.start()
+        # drawing and the display wrap the buffer directly, DirectShow frames come flipped with a negative
+        # row stride; a frame that is already contiguous is not copied
+        img = np.ascontiguousarray(img)
+        gray, scale = prepare_frame(img, self.settings.detection_width, self.profiler)
+        self.frame_size = (img.shape[1], img.shape[0])
+        detections = self.detector.detect(gray, scale, self.tracker)
+        self.profiler.lap('detect')
         scaling_coefficient = 1
-        if self.scaling_value_box.value() != 0 and self.scaling_distance != 0:
-            scaling_coefficient = self.scaling_value_box.value() / self.scaling_distance
-        ids = self.tracker.update(detections, self.frequency, scaling_coefficient)
-        output_image = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        if self.GrayCheckBox.isChecked():
-            output_image = gray
+        if self.scaling_mm != 0 and self.scaling_distance != 0:
+            scaling_coefficient = self.scaling_mm / self.scaling_distance
+        ids = self.tracker.update(detections, self.frequency, scaling_coefficient, timestamp)
+        self.profiler.lap('track')
+        # annotations go straight onto the captured frame, the gray image is copied because
+        # the motion gate keeps it as its reference
+        output_image = img
+        factor = 1
+        if self.gray_output:
+            output_image = gray.copy()
+            factor = 1 / scale
+        # keeps lines readable once the frame is scaled down to the 800 px wide label
+        line_scale = max(1.0, output_image.shape[1] / 800)
+        for x, y, w, h in self.settings.rois:
+            cv2.rectangle(output_image, (int(x * factor), int(y * factor)),
+                          (int((x + w) * factor), int((y + h) * factor)), (175, 75, 75), int(line_scale))
         for i in ids:
             x, y, r, id_ = i
-            cv2.circle(output_image, (x, y), r, (75, 175, 75), 2)
+            center = (int(x * factor), int(y * factor))
+            cv2.circle(output_image, center, int(r * factor), (75, 175, 75), int(2 * line_scale))
             radius_size = str(np.around(r, 1))
-            if self.scaling_value_box.value() != 0 and self.scaling_distance != 0:
-                radius_size = str(np.around(r * self.scaling_value_box.value() / self.scaling_distance, 1))
+            if self.scaling_mm != 0 and self.scaling_distance != 0:
+                radius_size = str(np.around(r * self.scaling_mm / self.scaling_distance, 1))
             cv2.putText(output_image,
                         str(radius_size) + '|' + str(id_),
-                        (x, y),
+                        center,
                         fontFace=cv2.FONT_HERSHEY_DUPLEX,
-                        fontScale=1,
+                        fontScale=line_scale,
                         color=(0, 255, 0))
-        output_image = qimage2ndarray.array2qimage(output_image)
-        self.image_label.setPixmap(QtGui.QPixmap.fromImage(output_image))
+        self.profiler.lap('draw')
+        return output_image
+
+    def show_frame(self, output_image):
+        self.profiler.start()
+        self.image_label.set_frame(output_image)
+        self.profiler.lap('wrap')
+
+    def show_latest_frame(self):
+        if self.pipeline is None:
+            return
+        output_image = self.pipeline.latest()
+        if output_image is not None:
+            self.show_frame(output_image)
 
-    def grab_frame(self):
-        self.graph.grab_frame()
+    def show_status(self):
+        if self.pipeline is None:
+            return
+        message = self.pipeline.status()
+        if self.skipped_frames:
+            message += ' | skipped %d' % self.skipped_frames
+        if self.profiler.enabled:
+            message = self.profiler.summary()
+        self.statusbar.showMessage(message)
+
+    def set_profiling(self, value):
+        self.profiler.clear()
+        self.profiler.set_enabled(value)
+
+    def save_trace(self):
+        trace_path = QtWidgets.QFileDialog.getSaveFileName(filter='Trace (*.json)')
+        if trace_path[0]:
+            self.profiler.dump_trace(trace_path[0])
 
     # endregion
 
@@ -313,7 +622,7 @@ class View(QtWidgets.QMainWindow):
         try:
             current_camera = self.camera_list_box.currentText()
             self.camera_list_box.clear()
-            camera_list = self.graph.get_input_devices()
+            camera_list = device_names()
             self.camera_list_box.addItems(camera_list)
             for i in range(len(camera_list)):
                 if current_camera == camera_list[i]:
@@ -322,21 +631,20 @@ class View(QtWidgets.QMainWindow):
             print(e)
             print('No camera found!!!')
 
-    def connect_camera(self):
+    def replay_file(self):
+        self.disconnect_camera()
+        video_path = QtWidgets.QFileDialog.getOpenFileName(filter='Video (*.mov *.mp4)')
+        if video_path[0]:
+            self.connect_camera(ReplaySource(video_path[0]))
+
+    def connect_camera(self, capture=None):
         if not self.camera_connected:
             try:
                 self.camera_only = True
                 self.camera_connected = True
-                self.graph.add_video_input_device(self.camera_list_box.currentIndex())
-                self.graph.add_sample_grabber(lambda image: self.set_image(image))
-                self.graph.add_null_render()
-                self.graph.prepare_preview_graph()
-                self.graph.run()
-                self.camera_timer.setInterval(20)
-                self.camera_timer.timeout.connect(self.grab_frame)
-                self.camera_thread.started.connect(self.camera_timer.start)
-                self.camera_thread.finished.connect(self.camera_timer.stop)
-                self.camera_thread.start()
+                if capture is None:
+                    capture = open_source(self.camera_list_box.currentIndex(), self.camera_list_box.currentText())
+                self.start_pipeline(DROP_OLDEST, capture)
             except Exception as e:
                 self.disconnect_camera()
                 print(e)
@@ -345,16 +653,12 @@ class View(QtWidgets.QMainWindow):
         self.camera_connected = False
         self.camera_only = False
         self.camera_thread.terminate()
-        self.graph = FilterGraph()
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
+        self.stop_pipeline()
         self.set_image()
-        if len(self.tracker.for_processing) > 0:
-            self.hide()
-            dialog = Processing(parent=self,
-                                data=self.tracker.for_processing,
-                                scaling_pix=self.scaling_distance,
-                                scaling_mm=self.scaling_value_box.value())
-            dialog.show()
-        self.tracker = Tracker(self.tracking_distance)
+        self.show_processing(self.finish_session())
         self.frequency = 50
 
     # endregion
@@ -362,31 +666,73 @@ class View(QtWidgets.QMainWindow):
     # region pyqtSlots region
     @QtCore.pyqtSlot(float)
     def set_resolution_scale(self, value):
-        self.resolution_scale = value
+        self.settings.resolution_scale = value
 
     @QtCore.pyqtSlot(int)
     def set_minimum_center_distance(self, value):
-        self.minimum_center_distance = value
+        self.settings.minimum_center_distance = value
 
     # todo: rename & remake on pyqtSlot decorator
     def update_param1_value(self, param1):
-        self.param1 = param1
+        self.settings.param1 = param1
 
     # todo: remake & on pyqtSlot decorator
     def update_param2_value(self, param2):
-        self.param2 = param2
+        self.settings.param2 = param2
 
     @QtCore.pyqtSlot(int)
     def set_minimum_radius(self, value):
-        self.minimum_radius = value
+        self.settings.minimum_radius = value
 
     @QtCore.pyqtSlot(int)
     def set_maximum_radius(self, value):
-        self.maximum_radius = value
+        self.settings.maximum_radius = value
+
+    @QtCore.pyqtSlot(int)
+    def set_motion_threshold(self, value):
+        self.settings.motion_threshold = value
+
+    @QtCore.pyqtSlot(int)
+    def set_detection_width(self, value):
+        self.settings.detection_width = value
+
+    @QtCore.pyqtSlot(str)
+    def set_detector_engine(self, value):
+        self.settings.engine = value
+
+    @QtCore.pyqtSlot(int)
+    def set_prediction_gate(self, value):
+        self.settings.prediction_gate = value
+        self.tracker.prediction_gate = value
+
+    @QtCore.pyqtSlot(int)
+    def set_detection_interval(self, value):
+        self.settings.detection_interval = value
 
     @QtCore.pyqtSlot(int)
     def set_tracking_distance(self, value):
-        self.tracking_distance = value
+        self.settings.tracking_distance = value
         self.tracker.tracking_distance = value
 
+    @QtCore.pyqtSlot(bool)
+    def set_optimal_matching(self, value):
+        self.settings.assignment = OPTIMAL if value else GREEDY
+        self.tracker.assignment = self.settings.assignment
+
+    @QtCore.pyqtSlot(bool)
+    def set_frame_skipping(self, value):
+        self.settings.frame_skipping = value
+
+    @QtCore.pyqtSlot(bool)
+    def set_tiled_detection(self, value):
+        self.settings.detection_threads = (os.cpu_count() or 1) if value else 1
+
+    @QtCore.pyqtSlot(bool)
+    def set_gray_output(self, value):
+        self.gray_output = value
+
+    @QtCore.pyqtSlot(float)
+    def set_scaling_mm(self, value):
+        self.scaling_mm = value
+
     # endregion
@@ -0,0 +1,75 @@
+import numpy as np
+
+G = 9.81
+BOOTSTRAP_SAMPLES = 1000
+BOOTSTRAP_BINS = 256
+CONFIDENCE = 0.95
+
+
+class ViscosityResult:
+    def __init__(self, viscosities, mean, median, low, high):
+        # per track values in Pa*s, the interval is for the mean
+        self.viscosities = viscosities
+        self.mean = mean
+        self.median = median
+        self.low = low
+        self.high = high
+
+    @property
+    def count(self):
+        return len(self.viscosities)
+
+
+# Stokes' law for a sphere at terminal speed: eta = 2/9 * (rho_object - rho_fluid) * g * r^2 / v
+# radius in pixels, speed in pixels/s, scale in mm/pixel, densities in g/cm^3; the result is in Pa*s
+def stokes_viscosity(radius, speed, fluid_density, object_density, scale=1):
+    radius = np.asarray(radius, dtype=np.float64) * scale * 1e-3
+    speed = np.asarray(speed, dtype=np.float64) * scale * 1e-3
+    density = (object_density - fluid_density) * 1000
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(speed > 0, 2 / 9 * density * G * radius ** 2 / speed, np.nan)
+
+
+# terminal speed in pixels/s as the slope of the travelled path over the last part of a trajectory,
+# trajectory rows are (seconds, cx, cy, r) as returned by Tracker.trajectory
+def fitted_speed(trajectory, tail=0.5):
+    trajectory = np.asarray(trajectory, dtype=np.float64)
+    if len(trajectory) < 2:
+        return 0.0
+    steps = np.hypot(np.diff(trajectory[:, 1]), np.diff(trajectory[:, 2]))
+    path = np.concatenate(([0], np.cumsum(steps)))
+    first = min(int(len(trajectory) * (1 - tail)), len(trajectory) - 2)
+    times = trajectory[first:, 0]
+    if times[-1] == times[0]:
+        return 0.0
+    return float(np.polyfit(times, path[first:], 1)[0])
+
+
+def bootstrap_means(values, samples=BOOTSTRAP_SAMPLES, seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(values)
+    if n <= BOOTSTRAP_BINS:
+        return values[rng.integers(0, n, (samples, n))].mean(axis=1)
+    # for many tracks the values are grouped into equal count quantile bins and each resample draws
+    # Poisson counts per bin (the Poisson bootstrap), so the cost does not grow with the number of tracks;
+    # c draws from a bin add c * variance of that bin to the variance of the sum, which is added as normal
+    # noise - the heavy tail of r^2/v sits in the top bins, leaving it out halves the interval
+    ordered = np.sort(values)
+    starts = np.linspace(0, n, BOOTSTRAP_BINS, endpoint=False).astype(np.int64)
+    sizes = np.diff(np.append(starts, n))
+    bin_means = np.add.reduceat(ordered, starts) / sizes
+    bin_variances = np.add.reduceat((ordered - np.repeat(bin_means, sizes)) ** 2, starts) / sizes
+    counts = rng.poisson(sizes, (samples, BOOTSTRAP_BINS))
+    sums = counts @ bin_means + rng.standard_normal(samples) * np.sqrt(counts @ bin_variances)
+    return sums / np.maximum(counts.sum(axis=1), 1)
+
+
+def estimate(radius, speed, fluid_density, object_density, scale=1, samples=BOOTSTRAP_SAMPLES,
+             confidence=CONFIDENCE):
+    viscosities = stokes_viscosity(radius, speed, fluid_density, object_density, scale)
+    viscosities = viscosities[np.isfinite(viscosities)]
+    if len(viscosities) == 0:
+        return ViscosityResult(viscosities, np.nan, np.nan, np.nan, np.nan)
+    means = bootstrap_means(viscosities, samples)
+    low, high = np.percentile(means, [(1 - confidence) / 2 * 100, (1 + confidence) / 2 * 100])
+    return ViscosityResult(viscosities, viscosities.mean(), np.median(viscosities), low, high)